@@ -1,60 +1,135 @@
+import warnings
 import torch
 import numpy as np
 from pyannote.audio import Pipeline
 from pyannote.core import Segment
 from preprocess import preprocess_audio
 from archive.vad import detect_voice_activity
-from pyannote.audio import Inference   # class that is used to extract embeddings
+from spectral_clustering import NMESCClustering
+from pyannote.audio import Model   # lower-level model, so we can batch the forward pass ourselves
 
-def extract_embeddings(waveform, sr, speech_segments):
+# Upper bound on how many crops go through the model in one forward pass
+MAX_BATCH_SIZE = 64
+
+def _bucket_lengths(num_samples, sr):
+    """
+    Returns the padded length (in samples) of the bucket each crop falls into.
+
+    Buckets are powers of two seconds (1s, 2s, 4s, 8s, ...), so padding never
+    more than doubles a crop and every batch within a bucket has the same shape.
+    """
+    seconds = np.maximum(num_samples / sr, 1.0)
+    return (sr * 2 ** np.ceil(np.log2(seconds))).astype(np.int64)
+
+def extract_embeddings(waveform, sr, speech_segments, max_batch_size=MAX_BATCH_SIZE):
     """
     Extracts a speaker embedding for each speech segment.
 
+    Segments are sorted by duration and grouped into power-of-two length buckets;
+    each bucket is zero-padded only up to its own length and sent through the
+    embedding model in batches.
+
     Args:
         waveform (np.ndarray): The audio waveform.
         sr (int): The sample rate.
-        speech_segments (list): A list of (start, end) tuples from VAD.
+        speech_segments (np.ndarray): An (N, 2) array of (start, end) times from VAD.
+        max_batch_size (int): Largest number of crops per forward pass (bounded by GPU memory).
 
     Returns:
-        list: A list of dictionaries, each containing the segment and its embedding.
+        list: A list of dictionaries, each containing the segment and its embedding
+              (a torch.Tensor row on the model's device).
     """
-    # 1. Initialize the pre-trained embedding model pipeline
-    print("Initializing embedding pipeline...")
+    # 1. Initialize the pre-trained embedding model
+    print("Initializing embedding model...")
     # This model is trained to produce speaker embeddings.
-    embedding_pipeline = Inference(
+    model = Model.from_pretrained(
         "pyannote/speaker-embedding",
         use_auth_token=True # Your HF token
     )
-    print("Embedding pipeline initialized.")
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
+    model.eval()
+    print("Embedding model initialized.")
+
+    if len(speech_segments) == 0:
+        return []
+
+    # 2. Convert the waveform once; crops below are zero-copy views into it.
+    wave_t = torch.from_numpy(np.ascontiguousarray(waveform, dtype=np.float32))
+    num_samples_total = wave_t.shape[0]
+
+    # 3. Precompute sample indices, sort by duration and group into length buckets
+    segments = np.asarray(speech_segments, dtype=np.float64).reshape(-1, 2)
+    start_samples = np.clip((segments[:, 0] * sr).astype(np.int64), 0, num_samples_total)
+    end_samples = np.clip((segments[:, 1] * sr).astype(np.int64), 0, num_samples_total)
+    crop_lengths = end_samples - start_samples
+    bucket_lengths = _bucket_lengths(crop_lengths, sr)
+    order = np.argsort(crop_lengths, kind='stable')
+
+    # 4. One forward pass per bucket, split into batches of at most max_batch_size
+    embedding_matrix = None
+    with torch.inference_mode():
+        for length in np.unique(bucket_lengths):
+            members = order[bucket_lengths[order] == length]
+            for batch_start in range(0, len(members), max_batch_size):
+                rows = members[batch_start:batch_start + max_batch_size]
+
+                # Pre-zeroed rows; each crop is copied into the front of its row
+                batch = torch.zeros(len(rows), 1, int(length))
+                weights = torch.zeros(len(rows), int(length))
+                for row, idx in enumerate(rows):
+                    batch[row, 0, :crop_lengths[idx]] = wave_t[start_samples[idx]:end_samples[idx]]
+                    weights[row, :crop_lengths[idx]] = 1.0
+
+                if device.type == "cuda":
+                    batch, weights = batch.pin_memory(), weights.pin_memory()
+                batch = batch.to(device, non_blocking=True)
+                weights = weights.to(device, non_blocking=True)
 
+                # The weights mask the zero padding out of the statistics pooling.
+                # They are given per sample and pyannote warns before resizing them to frames.
+                with warnings.catch_warnings():
+                    warnings.filterwarnings("ignore", message="Mismatch between frames")
+                    batch_embeddings = model(batch, weights=weights)
+
+                # Scatter back into the original segment order
+                if embedding_matrix is None:
+                    embedding_matrix = torch.empty(len(segments), batch_embeddings.shape[1], device=device)
+                embedding_matrix[torch.as_tensor(rows, device=device)] = batch_embeddings
+            print(f"Extracted {len(members)} embeddings in the {length / sr:.0f}s bucket")
+
+    # 5. Embeddings stay on the device (rows of one (N, D) tensor) for GPU clustering
     embeddings = []
-    
-    # 2. Iterate over each speech segment
-    for start, end in speech_segments:
-        # Create a pyannote.core.Segment object
-        segment = Segment(start, end)
-        
-        # The pipeline needs the waveform and the segment to extract from.
-        # It expects the waveform in a specific format.
-        input_data = {
-            "waveform": torch.from_numpy(waveform).unsqueeze(0),
-            "sample_rate": sr
-        }
-        
-        # Extract the embedding for the given segment
-        # The output is a (1, D) numpy array, where D is the embedding dimension.
-        # We use .squeeze() to remove the first dimension and get a 1D vector.
-        embedding = embedding_pipeline.crop(input_data, segment).squeeze()
-        
+    for (start, end), embedding in zip(segments.tolist(), embedding_matrix):
         embeddings.append({
             'segment': (start, end),
             'embedding': embedding,
             'duration': end - start
         })
-        print(f"Extracted embedding for segment {start:.2f}s - {end:.2f}s")
 
     return embeddings
 
+def cluster_embeddings(embeddings, min_speakers=1, max_speakers=20):
+    """
+    Clusters segment embeddings into speakers without leaving the device.
+
+    The cosine affinity matrix and its spectral decomposition are computed on the
+    embeddings' device with NME-SC.
+
+    Args:
+        embeddings (list): Output of extract_embeddings.
+        min_speakers (int): Minimum number of speakers.
+        max_speakers (int): Maximum number of speakers.
+
+    Returns:
+        np.ndarray: The speaker index of each embedding.
+    """
+    if len(embeddings) < 2:
+        return np.zeros(len(embeddings), dtype=np.int64)
+    embedding_matrix = torch.stack([e['embedding'] for e in embeddings]).float()
+    clustering = NMESCClustering(device=str(embedding_matrix.device), max_num_speakers=max_speakers)
+    return clustering.cluster(embedding_matrix, min_speakers, max_speakers)
+
 # --- Example Usage ---
 if __name__ == '__main__':
     # 1. Preprocess audio
@@ -67,9 +142,11 @@ if __name__ == '__main__':
     # 3. Extract embeddings for each speech segment
     # Let's only process segments longer than a certain duration to avoid noisy results
     min_duration_for_embedding = 0.5 # seconds
-    long_segments = [(start, end) for start, end in segments if end - start > min_duration_for_embedding]
+    segments = np.asarray(segments, dtype=np.float32).reshape(-1, 2)
+    durations = segments[:, 1] - segments[:, 0]
+    long_segments = segments[durations > min_duration_for_embedding]
     
-    if not long_segments:
+    if len(long_segments) == 0:
         print("No speech segments long enough for embedding extraction.")
     else:
         embedding_list = extract_embeddings(processed_waveform, sample_rate, long_segments)
@@ -82,3 +159,7 @@ if __name__ == '__main__':
             print(f"Embedding Shape: {first_embedding_info['embedding'].shape}")
             # print(f"Embedding Vector (first 10 values): {first_embedding_info['embedding'][:10]}")
 
+            # 4. Cluster the embeddings into speakers on the same device
+            speaker_ids = cluster_embeddings(embedding_list)
+            print(f"Found {len(set(speaker_ids))} speakers.")
+
@@ -1,33 +1,80 @@
 
+import functools
+import logging
+import threading
 import torch
 from pyannote.audio import Pipeline # The main object we need from the library is 'Pipeline'.
 import numpy as np
+from pipeline_cache import audio_fingerprint, cached_pipeline
+from model_precision import reduce_segmentation_precision
+from chunked_inference import DEFAULT_CHUNK_SECONDS, DEFAULT_OVERLAP_SECONDS, detect_in_chunks, iter_array_chunks
 # Note: We do NOT need 'from pyannote.audio import VoiceActivityDetection' here.
 
-def detect_voice_activity(waveform, sr):
-    """
-    Applies Voice Activity Detection using a pre-trained pyannote.audio pipeline.
-    """
-    print("Initializing VAD pipeline...")
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Pretrained pipeline used for voice activity detection
+VAD_MODEL = "pyannote/voice-activity-detection"
+
+# Guards the first construction of a pipeline when called from several threads
+_PIPELINE_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize=4)
+def _load_vad_pipeline(token, device):
+    logger.info("Initializing VAD pipeline...")
     # This single line handles loading the correct model and setting up the VAD logic.
     pipeline = Pipeline.from_pretrained(
-        "pyannote/voice-activity-detection",
-        use_auth_token=True # Or your token string
+        VAD_MODEL,
+        use_auth_token=token # True uses the cached HF login, or pass your token string
     )
-    print("VAD pipeline initialized.")
+    pipeline.to(torch.device(device))
+    reduce_segmentation_precision(pipeline, device)
+    logger.info("VAD pipeline initialized.")
+    return pipeline
 
-    input_tensor = torch.from_numpy(waveform).unsqueeze(0)
-    audio_data = {"waveform": input_tensor, "sample_rate": sr}
+def _get_vad_pipeline(token=True, device=None):
+    """Returns the VAD pipeline for (token, device), loading it only on first use."""
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    with _PIPELINE_LOCK:
+        return _load_vad_pipeline(token, device)
+
+def detect_voice_activity(waveform, sr, hf_token=True, cache=None, chunk_seconds=DEFAULT_CHUNK_SECONDS, overlap_seconds=DEFAULT_OVERLAP_SECONDS, audio_data=None):
+    """
+    Applies Voice Activity Detection using a pre-trained pyannote.audio pipeline.
+
+    The pipeline is loaded once per (token, device) and reused across calls.
+    Long audio is processed in chunks of chunk_seconds that overlap by overlap_seconds, so
+    memory stays bounded regardless of the file length (see chunked_inference.py).
+    With cache set to a directory, results for identical audio are loaded from disk.
+    audio_data, from diarize.prepare_audio_input, lets the chunks be cropped from a device
+    tensor shared with later stages instead of being copied from the host.
+
+    Returns:
+        np.ndarray: An (N, 2) float32 array of (start, end) times of the speech regions.
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    pipeline = _get_vad_pipeline(hf_token, device)
+
+    # Contiguous float32 so each chunk is a zero-copy view; on GPU the chunks are staged
+    # through one pinned buffer so the host-to-device copies run asynchronously, unless a
+    # prepared device tensor is given.
+    waveform = np.ascontiguousarray(waveform, dtype=np.float32)
+    chunk_samples = int(chunk_seconds * sr)
+    overlap_samples = int(overlap_seconds * sr)
+    source = audio_data["waveform"][0] if audio_data is not None else waveform
+    chunks = iter_array_chunks(source, chunk_samples, overlap_samples)
+    run_chunks = functools.partial(detect_in_chunks, pipeline, sr=sr, chunk_samples=chunk_samples, overlap_samples=overlap_samples, device=device)
+
+    logger.info("Applying VAD...")
+    fingerprint = audio_fingerprint(waveform, sr) if cache is not None else None
+    speech_segments = cached_pipeline(
+        run_chunks, chunks, cache, VAD_MODEL, fingerprint,
+        key_params={"chunk_seconds": chunk_seconds, "overlap_seconds": overlap_seconds}
+    ).astype(np.float32)
+    logger.info(f"Detected {len(speech_segments)} speech segments.")
 
-    print("Applying VAD...")
-    vad_result = pipeline(audio_data)
-    
-    speech_segments = []
-    for segment in vad_result.itersegments():
-        speech_segments.append((segment.start, segment.end))
-        # This print statement is optional but helpful for debugging
-        # print(f"Detected speech from {segment.start:.2f}s to {segment.end:.2f}s")
-        
     return speech_segments
 
 # --- Example Usage (Optional - for testing this file directly) ---
@@ -40,8 +87,8 @@ if __name__ == '__main__':
     
     # segments = detect_voice_activity(processed_waveform, sample_rate)
     
-    # print("\nFinal list of speech segments:")
-    # print(segments)
+    # logger.info("Final list of speech segments:")
+    # logger.info(segments)
     pass # Pass so it doesn't run by default when imported.
 
 
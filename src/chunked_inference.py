@@ -0,0 +1,126 @@
+import numpy as np
+import soundfile as sf
+import torch
+import logging
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default window and overlap used when running detection pipelines on long audio
+DEFAULT_CHUNK_SECONDS = 60.0
+DEFAULT_OVERLAP_SECONDS = 2.0
+
+def iter_array_chunks(waveform: np.ndarray, chunk_samples: int, overlap_samples: int):
+    """
+    Yields (offset, chunk) views of a mono waveform (array or 1-D tensor), consecutive chunks sharing overlap_samples.
+    """
+    step = chunk_samples - overlap_samples
+    for offset in range(0, max(len(waveform) - overlap_samples, 1), step):
+        yield offset, waveform[offset:offset + chunk_samples]
+
+def iter_file_chunks(audio_path: str, chunk_samples: int, overlap_samples: int):
+    """
+    Yields (offset, chunk) mono float32 blocks read from an audio file, without loading the whole file.
+    """
+    step = chunk_samples - overlap_samples
+    for i, block in enumerate(sf.blocks(audio_path, blocksize=chunk_samples, overlap=overlap_samples, dtype='float32', always_2d=True)):
+        yield i * step, np.ascontiguousarray(block.mean(axis=1))
+
+def iter_stream_chunks(blocks, chunk_samples: int, overlap_samples: int):
+    """
+    Regroups a stream of mono blocks (e.g. preprocess.preprocess_audio_stream) into
+    (offset, chunk) pairs of chunk_samples, consecutive chunks sharing overlap_samples.
+    Used by diarize.stream_diarize.
+
+    Only one chunk's worth of samples is buffered at a time.
+    """
+    step = chunk_samples - overlap_samples
+    buffer = np.empty(0, dtype=np.float32)
+    offset = 0
+    for block in blocks:
+        if isinstance(block, tuple):
+            block = block[0]  # (block, sample_rate) pairs
+        buffer = np.concatenate([buffer, block])
+        while len(buffer) >= chunk_samples:
+            yield offset, buffer[:chunk_samples]
+            buffer = buffer[step:]
+            offset += step
+    # The remainder starts a last chunk unless it is already covered by the previous overlap
+    if (offset == 0 and len(buffer)) or len(buffer) > overlap_samples:
+        yield offset, buffer
+
+def merge_intervals(intervals: np.ndarray) -> np.ndarray:
+    """
+    Returns the union of an (N, 2) array of (start, end) intervals, sorted by start.
+    """
+    if len(intervals) == 0:
+        return intervals.reshape(0, 2)
+    intervals = intervals[np.argsort(intervals[:, 0], kind='stable')]
+    # A new group starts wherever an interval begins after every earlier one has ended
+    running_end = np.maximum.accumulate(intervals[:, 1])
+    new_group = np.concatenate([[True], intervals[1:, 0] > running_end[:-1]])
+    starts = intervals[new_group, 0]
+    ends = np.maximum.reduceat(intervals[:, 1], np.flatnonzero(new_group))
+    return np.stack([starts, ends], axis=1)
+
+def detect_in_chunks(pipeline, chunks, sr: int, chunk_samples: int, overlap_samples: int, device: str = "cpu") -> np.ndarray:
+    """
+    Runs a detection pipeline (VAD, overlap detection) chunk by chunk and stitches the results.
+
+    Each chunk keeps the regions from half-way into its leading overlap up to half-way into
+    the next chunk's, so every instant is decided by the chunk that saw the most context
+    around it; the cropped regions are then merged. Peak memory is bounded by one chunk.
+
+    Args:
+        pipeline: A pyannote pipeline whose output timeline marks the detected regions.
+        chunks: An iterable of (offset_in_samples, mono float32 chunk), e.g. from
+            `iter_array_chunks` or `iter_file_chunks`. Chunks may be NumPy arrays or tensors.
+        sr (int): Sample rate of the chunks.
+        chunk_samples (int): Length of a full chunk, in samples.
+        overlap_samples (int): Overlap between consecutive chunks, in samples.
+        device (str): Device the pipeline runs on.
+
+    Returns:
+        np.ndarray: An (N, 2) float64 array of merged (start, end) times in seconds.
+    """
+    half_overlap = 0.5 * overlap_samples / sr
+
+    # One pinned staging buffer is reused for every host chunk. The pipeline returns its output
+    # on the host, so the previous transfer has completed before the buffer is refilled.
+    pinned = None
+
+    regions, previous = [], None
+    for num_chunks, (offset, chunk) in enumerate(chunks, start=1):
+        if torch.is_tensor(chunk):
+            # Already a tensor (e.g. a view of a shared device copy), no transfer needed
+            chunk_tensor = chunk
+        else:
+            chunk_tensor = torch.from_numpy(np.ascontiguousarray(chunk, dtype=np.float32))
+            if device == "cuda":
+                if pinned is None:
+                    pinned = torch.empty(chunk_samples, dtype=torch.float32, pin_memory=True)
+                staged = pinned[:len(chunk_tensor)]
+                staged.copy_(chunk_tensor)
+                chunk_tensor = staged.to(device, non_blocking=True)
+        output = pipeline({"waveform": chunk_tensor.unsqueeze(0), "sample_rate": sr})
+
+        start_time = offset / sr
+        own_start = start_time + half_overlap if offset > 0 else 0.0
+        # The previous chunk hands over to this one half-way through their overlap
+        if previous is not None:
+            regions.append(np.clip(previous, None, own_start))
+        timeline = output.get_timeline().support()
+        current = np.fromiter(
+            (t for segment in timeline for t in (segment.start, segment.end)),
+            dtype=np.float64,
+            count=2 * len(timeline)
+        ).reshape(-1, 2) + start_time
+        previous = np.clip(current, own_start, None)
+
+    if previous is not None:
+        regions.append(previous)
+        logger.info(f"Processed {num_chunks} chunks of up to {chunk_samples / sr:.0f}s.")
+
+    regions = np.concatenate(regions) if regions else np.empty((0, 2))
+    return merge_intervals(regions[regions[:, 1] > regions[:, 0]])
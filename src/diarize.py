@@ -1,52 +1,243 @@
 # src/diarize.py (Final Revised run_diarization function)
 
-import torch
-from pyannote.audio import Pipeline
-from preprocess import preprocess_audio
-import csv
+import numpy as np
 import os
 import argparse
 import sys
 import logging
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import Listener, Client
 from typing import Optional
+from model_precision import cast_model_to_half_precision, restore_full_precision
+
+# torch, pyannote, pandas, soundfile and the preprocessing stack are imported inside the
+# functions that need them, so `--help` and argument errors return without the import cost.
+
+# Pretrained pipeline used for diarization
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+
+# --- Persistent worker defaults ---
+# The worker listens on localhost only; the auth token doubles as the connection authkey.
+DEFAULT_SERVER_HOST = "localhost"
+DEFAULT_SERVER_PORT = 6000
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# --- Global Pipeline Variable ---
-# To avoid reloading the model on every call if used in a larger app
-PIPELINE = None
+# --- Per-Thread Pipeline Cache ---
+# To avoid reloading the model on every call if used in a larger app.
+# Thread-local so that each batch worker (see `diarize_batch`) owns a pipeline on its own GPU.
+class _PipelineState(threading.local):
+    pipeline = None
+    # The pipeline's own agglomerative clustering, and the optional NME-SC replacement
+    default_clustering = None
+    spectral_clustering = None
+    # Reduced-precision dtype used by the pipeline's torch submodels (None when running in FP32)
+    dtype = None
+    # Hook handles of the reduced-precision cast, as (model, handles) pairs, for undoing it
+    precision_hooks = ()
+
+_PIPELINE_STATE = _PipelineState()
+
+def _restore_full_precision(state):
+    """Undoes the reduced-precision cast of the pipeline's segmentation and embedding models."""
+    for model, handles in state.precision_hooks:
+        restore_full_precision(model, handles)
+    state.precision_hooks = ()
+    state.dtype = None
+
+def _compile_and_warmup_submodels(pipeline):
+    """
+    Compiles the segmentation and embedding subnets with CUDA graph capture and warms them up.
+
+    The warmup runs here, on the thread that loads the pipeline, using the canonical chunk
+    shape so the captured graphs are reused by every chunk of the sliding window.
+    If compilation or the warmup fails, the eager models are restored in FP32.
+    """
+    import torch
+
+    segmentation_model = pipeline._segmentation.model
+    embedding_model = pipeline._embedding.model_
+
+    sample_rate = segmentation_model.hparams.sample_rate
+    num_samples = int(sample_rate * pipeline._segmentation.duration)
+    num_frames = segmentation_model.num_frames(num_samples)
+
+    # Full batches and the smaller trailing batch each get their own graph
+    torch._dynamo.config.cache_size_limit = 16
+
+    try:
+        pipeline._segmentation.model = torch.compile(segmentation_model, mode="reduce-overhead", fullgraph=False)
+        pipeline._embedding.model_ = torch.compile(embedding_model, mode="reduce-overhead", fullgraph=False)
+
+        device = torch.device("cuda")
+        chunks = torch.zeros(pipeline._segmentation.batch_size, 1, num_samples, device=device)
+        embedding_chunks = torch.zeros(pipeline.embedding_batch_size, 1, num_samples, device=device)
+        masks = torch.ones(pipeline.embedding_batch_size, num_frames, device=device)
+        with torch.inference_mode():
+            pipeline._segmentation.model(chunks)
+            pipeline._embedding.model_(embedding_chunks, weights=masks)
+        torch.cuda.synchronize()
+        logger.info("Segmentation and embedding models compiled and warmed up.")
+    except Exception as e:
+        logger.warning(f"torch.compile warmup failed, falling back to eager mode in FP32: {e}")
+        pipeline._segmentation.model = segmentation_model
+        pipeline._embedding.model_ = embedding_model
+        # The failure may come from the reduced-precision cast itself; don't keep running it
+        _restore_full_precision(_PIPELINE_STATE)
+
+def _warmup_pipeline(pipeline):
+    """
+    Runs 5s of silence through the whole pipeline so CUDA kernels and allocator pools are primed.
+
+    Runs synchronously on the loading thread, so the first real request does not pay for it.
+    """
+    import torch
+
+    logger.info("Warming up diarization pipeline...")
+    try:
+        warmup_audio = {"waveform": torch.zeros(1, 16000 * 5, device="cuda"), "sample_rate": 16000}
+        with torch.inference_mode():
+            pipeline(warmup_audio)
+        torch.cuda.synchronize()
+        logger.info("Pipeline warmup complete.")
+    except Exception as e:
+        logger.warning(f"Pipeline warmup failed, continuing without it in FP32: {e}")
+        _restore_full_precision(_PIPELINE_STATE)
 
 def initialize_pipeline(auth_token: str):
     """Initializes the pyannote pipeline and caches it."""
-    global PIPELINE
-    if PIPELINE is None:
+    import torch
+    from pyannote.audio import Pipeline
+
+    # This module only runs inference; never track gradients (grad mode is per thread)
+    torch.set_grad_enabled(False)
+
+    state = _PIPELINE_STATE
+    if state.pipeline is None:
         logger.info("Initializing diarization pipeline for the first time...")
         try:
-            PIPELINE = Pipeline.from_pretrained(
-                "pyannote/speaker-diarization-3.1",
+            pipeline = Pipeline.from_pretrained(
+                DIARIZATION_MODEL,
                 use_auth_token=auth_token
             )
             if torch.cuda.is_available():
-                PIPELINE.to(torch.device("cuda"))
-                logger.info("Pipeline moved to GPU.")
+                pipeline.to(torch.device("cuda"))
+                logger.info(f"Pipeline moved to GPU {torch.cuda.current_device()}.")
+                # Segmentation and embedding are the two hot subnets; run them in reduced precision.
+                # Their feature front ends (SincNet, fbank) and inputs stay in FP32.
+                state.dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+                state.precision_hooks = [
+                    (model, cast_model_to_half_precision(model, state.dtype))
+                    for model in (pipeline._segmentation.model, pipeline._embedding.model_)
+                ]
+                logger.info(f"Segmentation and embedding models cast to {state.dtype}.")
+                _compile_and_warmup_submodels(pipeline)
+                _warmup_pipeline(pipeline)
             else:
                 logger.info("GPU not available. Using CPU for pipeline.")
+            state.pipeline = pipeline
+            state.default_clustering = pipeline.clustering
             logger.info("Diarization pipeline initialized successfully.")
         except Exception as e:
             logger.error(f"Failed to load pipeline: {e}")
             if "401" in str(e) or "access token" in str(e).lower():
                  logger.error("Hint: Hugging Face authentication error. Check your auth token.")
             sys.exit(1)
-    return PIPELINE
+    return state.pipeline
+
+def prepare_audio_input(waveform, sr: int) -> dict:
+    """
+    Builds the {"waveform", "sample_rate"} input shared by the pyannote pipelines.
+
+    The waveform becomes a zero-copy (1, num_samples) view of a contiguous float32 buffer
+    (float64 input is converted here rather than silently promoted later; read-only input
+    is copied). On GPU it is pinned
+    and transferred once, so every pipeline given this dict (VAD, diarization) crops its chunks
+    from the same device tensor instead of making its own host-to-device copy.
+
+    Args:
+        waveform (np.ndarray): Mono waveform.
+        sr (int): Sample rate.
 
-def run_diarization(waveform, sr, min_speakers: Optional[int] = None, max_speakers: Optional[int] = None, clustering_threshold: Optional[float] = None, auth_token: str = None):
+    Returns:
+        dict: The pipeline input.
+    """
+    import torch
+
+    waveform = np.ascontiguousarray(waveform.reshape(1, -1), dtype=np.float32)
+    if not waveform.flags.writeable:
+        # A read-only buffer (np.frombuffer, the memory map of a preprocessing cache hit)
+        # can't back a torch tensor safely; give torch its own copy
+        waveform = np.array(waveform)
+    waveform_tensor = torch.as_tensor(waveform)
+    if torch.cuda.is_available():
+        waveform_tensor = waveform_tensor.pin_memory().to("cuda", non_blocking=True)
+    return {"waveform": waveform_tensor, "sample_rate": sr}
+
+def _single_speaker_diarization(waveform, sr, auth_token: str, cache: Optional[str] = None, audio_data: Optional[dict] = None):
+    """
+    Returns a one-speaker Annotation covering the speech regions found by the VAD pipeline.
+
+    With a single speaker there is nothing to cluster, so this skips the embedding pass
+    (the bulk of the diarization runtime) and the diarization model load.
+    """
+    import torch
+    from archive.vad import VAD_MODEL, _get_vad_pipeline
+    from pipeline_cache import audio_fingerprint, cached_pipeline
+
+    logger.info("max_speakers=1: skipping speaker embeddings and using voice activity detection.")
+    pipeline = _get_vad_pipeline(auth_token)
+
+    if audio_data is None:
+        audio_data = prepare_audio_input(waveform, sr)
+
+    fingerprint = audio_fingerprint(waveform, sr) if cache is not None else None
+    with torch.inference_mode():
+        vad_result = cached_pipeline(pipeline, audio_data, cache, VAD_MODEL, fingerprint)
+
+    # Relabel every speech region as the one speaker, using pyannote's label format
+    return vad_result.rename_labels({label: "SPEAKER_00" for label in vad_result.labels()}).support()
+
+def run_diarization(waveform, sr, min_speakers: Optional[int] = None, max_speakers: Optional[int] = None, clustering_threshold: Optional[float] = None, auth_token: str = None, return_embeddings: bool = False, spectral_clustering: bool = False, cache: Optional[str] = None, audio_data: Optional[dict] = None):
     """
     Runs the speaker diarization pipeline with configurable parameters.
+
+    audio_data is an optional input already built by `prepare_audio_input` for this waveform;
+    passing it lets several stages share one device copy of the audio.
+
+    With return_embeddings=True, returns (diarization, embeddings) where row i of
+    embeddings is the centroid of diarization.labels()[i].
+    With spectral_clustering=True, the pipeline's agglomerative clustering is swapped for
+    GPU-resident NME-SC (see spectral_clustering.py); clustering_threshold is then unused.
+    With cache set to a directory, the segmentation and speaker embeddings of this audio are
+    reused from disk, so runs that only change the clustering settings or speaker counts skip
+    the neural models (see pipeline_cache.cached_diarization).
+    With max_speakers=1 (and no embeddings requested), speaker embeddings are skipped entirely:
+    the VAD pipeline's speech regions are returned as a single speaker.
     """
+    import torch
+    from spectral_clustering import NMESCClustering
+    from pipeline_cache import audio_fingerprint, cached_diarization
+
+    if max_speakers == 1 and not return_embeddings:
+        return _single_speaker_diarization(waveform, sr, auth_token, cache, audio_data)
+
     pipeline = initialize_pipeline(auth_token)
 
+    state = _PIPELINE_STATE
+    if spectral_clustering:
+        if state.spectral_clustering is None:
+            state.spectral_clustering = NMESCClustering()
+        pipeline.clustering = state.spectral_clustering
+        logger.info("Using NME-SC spectral clustering.")
+    else:
+        pipeline.clustering = state.default_clustering
+
     # --- Set hyperparameters for internal components directly on the pipeline object ---
     # This modifies the pipeline's behavior for this run and subsequent runs
     # if the pipeline instance is reused.
@@ -55,63 +246,417 @@ def run_diarization(waveform, sr, min_speakers: Optional[int] = None, max_speake
         # Access the 'clustering' component and set its 'threshold' attribute
         # Make sure this 'clustering' attribute exists on the pipeline object.
         # This is the standard way to set it for pyannote.audio SpeakerDiarization.
-        pipeline.clustering.threshold = clustering_threshold
+        state.default_clustering.threshold = clustering_threshold
 
-    audio_data = {"waveform": torch.from_numpy(waveform).unsqueeze(0), "sample_rate": sr}
+    if audio_data is None:
+        audio_data = prepare_audio_input(waveform, sr)
 
     logger.info("Applying diarization...")
 
     # The pipeline's __call__ method takes min_speakers and max_speakers directly
     # but does NOT take a 'hyperparameters' keyword argument for the pre-trained pipeline.
-    diarization_result = pipeline(
-        audio_data,
-        min_speakers=min_speakers,
-        max_speakers=max_speakers
-    )
+    # The waveform stays FP32; the reduced-precision backbones cast at their own boundary.
+    fingerprint = audio_fingerprint(waveform, sr) if cache is not None else None
+    with torch.inference_mode():
+        diarization_result = cached_diarization(
+            pipeline,
+            audio_data,
+            cache,
+            DIARIZATION_MODEL,
+            fingerprint,
+            key_params={
+                # Settings that change the segmentation or embeddings, not the clustering
+                "precision": str(state.dtype),
+                "embedding_exclude_overlap": pipeline.embedding_exclude_overlap
+            },
+            min_speakers=min_speakers,
+            max_speakers=max_speakers,
+            return_embeddings=return_embeddings
+        )
 
     return diarization_result
 
+def _assign_global_speakers(labels, embeddings, centroids: list, threshold: float) -> dict:
+    """
+    Maps the local speaker labels of one chunk onto the running table of global speakers.
+
+    Local speakers are greedily matched to the most similar unused centroid (cosine similarity
+    >= threshold); unmatched ones become new global speakers. Centroids are updated in place.
+    """
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    valid = ~np.isnan(normalized).any(axis=1)
+
+    candidates = []
+    if centroids:
+        table = np.stack(centroids)
+        table = table / np.linalg.norm(table, axis=1, keepdims=True)
+        similarity = np.where(valid[:, None], np.nan_to_num(normalized) @ table.T, -np.inf)
+        for i, j in zip(*np.nonzero(similarity >= threshold)):
+            candidates.append((similarity[i, j], i, j))
+
+    mapping, used = {}, set()
+    for _, i, j in sorted(candidates, reverse=True):
+        if labels[i] in mapping or j in used:
+            continue
+        mapping[labels[i]] = j
+        used.add(j)
+        centroids[j] = centroids[j] + normalized[i]
+
+    for i, label in enumerate(labels):
+        if label not in mapping:
+            mapping[label] = len(centroids)
+            centroids.append(normalized[i] if valid[i] else np.zeros(embeddings.shape[1]))
+
+    return {label: f"SPEAKER_{index:02d}" for label, index in mapping.items()}
+
+# Sentinel marking the end of an iterator in _with_last_flag
+_END = object()
+
+def _with_last_flag(iterable):
+    """Yields (item, is_last) pairs, looking one item ahead."""
+    iterator = iter(iterable)
+    current = next(iterator, _END)
+    while current is not _END:
+        following = next(iterator, _END)
+        yield current, following is _END
+        current = following
+
+def stream_diarize(path: str, auth_token: str = None, chunk_seconds: int = 600, overlap: int = 10, min_speakers: Optional[int] = None, max_speakers: Optional[int] = None, clustering_threshold: Optional[float] = None, threshold: float = 0.5, max_gap: Optional[float] = None, spectral_clustering: bool = False, cache: Optional[str] = None):
+    """
+    Diarizes a long audio file chunk by chunk without loading it fully into memory.
+
+    The file goes through the same mono / 16 kHz resample / RMS-normalization chain as
+    `preprocess_audio`, streamed block by block (preprocess.preprocess_audio_stream), and is
+    regrouped into overlapping chunks. Each chunk is diarized on its own and keeps the
+    turns from the middle of the overlaps it shares with its neighbours. Speaker labels are
+    made consistent across chunks by matching each chunk's speaker embeddings against a
+    running centroid table, and turns of the same speaker split by a chunk seam are merged.
+
+    Args:
+        path (str): Path to the input audio file.
+        auth_token (str): Hugging Face authentication token.
+        chunk_seconds (int): Length of each chunk in seconds.
+        overlap (int): Overlap between consecutive chunks in seconds.
+        min_speakers (int, optional): Minimum number of speakers per chunk.
+        max_speakers (int, optional): Maximum number of speakers per chunk.
+        clustering_threshold (float, optional): Clustering threshold.
+        threshold (float): Minimum cosine similarity to match a chunk speaker to a known speaker.
+        max_gap (float, optional): Largest gap (in seconds) bridged when merging across a seam.
+                                   Defaults to overlap / 2.
+        spectral_clustering (bool): Cluster each chunk with NME-SC (see `run_diarization`).
+        cache (str, optional): Cache directory for each chunk's segmentation and embeddings.
+
+    Returns:
+        Annotation: The stitched diarization.
+    """
+    from pyannote.core import Annotation, Segment
+    from chunked_inference import iter_stream_chunks
+    from preprocess import preprocess_audio_stream
+
+    sr = 16000  # pyannote's training rate, as produced by preprocess_audio
+    blocksize = chunk_seconds * sr
+    overlap_samples = overlap * sr
+    half_overlap = overlap / 2
+    max_gap = half_overlap if max_gap is None else max_gap
+
+    centroids = []
+    turns = []          # [start, end, speaker], in time order
+    open_turns = {}     # speaker -> last turn of the previous chunk, may still be extended
+    total_seconds = 0.0
+
+    chunks = iter_stream_chunks(preprocess_audio_stream(path, target_sr=sr), blocksize, overlap_samples)
+    for block_index, ((offset_samples, block), is_last) in enumerate(_with_last_flag(chunks)):
+        offset = offset_samples / sr
+        total_seconds = offset + len(block) / sr
+        # Each chunk owns the region between the midpoints of its overlaps
+        owned_start = offset + half_overlap if block_index > 0 else 0.0
+        owned_end = offset + len(block) / sr - (0.0 if is_last else half_overlap)
+
+        logger.info(f"Diarizing chunk {block_index} ({offset:.1f}s - {offset + len(block) / sr:.1f}s)...")
+        diarization, embeddings = run_diarization(
+            block,
+            sr,
+            min_speakers=min_speakers,
+            max_speakers=max_speakers,
+            clustering_threshold=clustering_threshold,
+            auth_token=auth_token,
+            return_embeddings=True,
+            spectral_clustering=spectral_clustering,
+            cache=cache
+        )
+        speaker_map = _assign_global_speakers(diarization.labels(), embeddings, centroids, threshold)
+
+        previous_open_turns, open_turns = open_turns, {}
+        for turn, _, label in diarization.itertracks(yield_label=True):
+            start = max(turn.start + offset, owned_start)
+            end = min(turn.end + offset, owned_end)
+            if end <= start:
+                continue
+            speaker = speaker_map[label]
+
+            previous = previous_open_turns.pop(speaker, None)
+            if previous is not None and start - owned_start < max_gap and owned_start - previous[1] < max_gap:
+                previous[1] = max(previous[1], end)
+                current = previous
+            else:
+                current = [start, end, speaker]
+                turns.append(current)
+            if owned_end - current[1] < max_gap:
+                open_turns[speaker] = current
+
+    annotation = Annotation(uri=os.path.splitext(os.path.basename(path))[0])
+    for start, end, speaker in turns:
+        annotation[Segment(start, end)] = speaker
+    logger.info(f"Streaming diarization complete: {len(centroids)} speakers over {total_seconds:.2f}s.")
+    return annotation
+
+def serve(auth_token: str, host: str = DEFAULT_SERVER_HOST, port: int = DEFAULT_SERVER_PORT, cache: Optional[str] = None):
+    """
+    Runs a long-lived diarization worker that keeps the pipeline resident.
+
+    Each client connection sends one request (a float32 waveform as bytes plus the
+    diarization parameters) and receives the resulting Annotation, so the model-load
+    cost is paid once instead of once per file.
+
+    Args:
+        auth_token (str): Hugging Face authentication token, also used as the connection authkey.
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+        cache (str, optional): Cache directory used for every request (see `run_diarization`).
+    """
+    # Loads the pipeline and, on GPU, warms it up before accepting work
+    initialize_pipeline(auth_token)
+
+    with Listener((host, port), authkey=auth_token.encode()) as listener:
+        logger.info(f"Diarization worker listening on {host}:{port}")
+        while True:
+            try:
+                with listener.accept() as conn:
+                    request = conn.recv()
+                    waveform = np.frombuffer(request["waveform"], dtype=np.float32)
+                    logger.info(f"Received request: {len(waveform) / request['sample_rate']:.2f}s of audio")
+                    try:
+                        diarization = run_diarization(
+                            waveform,
+                            request["sample_rate"],
+                            min_speakers=request.get("min_speakers"),
+                            max_speakers=request.get("max_speakers"),
+                            clustering_threshold=request.get("clustering_threshold"),
+                            auth_token=auth_token,
+                            spectral_clustering=request.get("spectral_clustering", False),
+                            cache=cache
+                        )
+                        conn.send({"diarization": diarization})
+                    except Exception as e:
+                        logger.error(f"Diarization request failed: {e}", exc_info=True)
+                        conn.send({"error": str(e)})
+            except KeyboardInterrupt:
+                logger.info("Shutting down diarization worker.")
+                break
+            except Exception as e:
+                logger.error(f"Error handling worker connection: {e}")
+
+def run_diarization_remote(waveform, sr, min_speakers: Optional[int] = None, max_speakers: Optional[int] = None, clustering_threshold: Optional[float] = None, auth_token: str = None, host: str = DEFAULT_SERVER_HOST, port: int = DEFAULT_SERVER_PORT, spectral_clustering: bool = False):
+    """
+    Sends a waveform to a running diarization worker (see `serve`) and returns its Annotation.
+    """
+    request = {
+        "waveform": np.ascontiguousarray(waveform, dtype=np.float32).tobytes(),
+        "sample_rate": sr,
+        "min_speakers": min_speakers,
+        "max_speakers": max_speakers,
+        "clustering_threshold": clustering_threshold,
+        "spectral_clustering": spectral_clustering
+    }
+    logger.info(f"Sending audio to diarization worker at {host}:{port}...")
+    with Client((host, port), authkey=auth_token.encode()) as conn:
+        conn.send(request)
+        response = conn.recv()
+
+    if "error" in response:
+        raise RuntimeError(f"Diarization worker failed: {response['error']}")
+    return response["diarization"]
+
 def write_results_to_csv(diarization, output_csv_path: str):
+    import pandas as pd
+
     try:
-        with open(output_csv_path, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["start_seconds", "end_seconds", "speaker_label"])
-            for turn, _, speaker in diarization.itertracks(yield_label=True):
-                writer.writerow([f"{turn.start:.3f}", f"{turn.end:.3f}", speaker])
+        starts, ends, speakers = [], [], []
+        for turn, _, speaker in diarization.itertracks(yield_label=True):
+            starts.append(turn.start)
+            ends.append(turn.end)
+            speakers.append(speaker)
+        pd.DataFrame({
+            "start_seconds": np.asarray(starts, dtype=np.float64),
+            "end_seconds": np.asarray(ends, dtype=np.float64),
+            "speaker_label": speakers
+        }).to_csv(output_csv_path, index=False, float_format="%.3f")
         logger.info(f"Diarization results successfully written to {output_csv_path}")
     except Exception as e:
         logger.error(f"Error writing to CSV file: {e}")
 
 def write_rttm_file(diarization, output_rttm_path: str, audio_filename: str):
     try:
+        # Same line layout as Annotation.write_rttm, with the file ID filled in directly
+        lines = [
+            f"SPEAKER {audio_filename} 1 {turn.start:.3f} {turn.duration:.3f} <NA> <NA> {speaker} <NA> <NA>\n"
+            for turn, _, speaker in diarization.itertracks(yield_label=True)
+        ]
         with open(output_rttm_path, "w") as rttm_file:
-            diarization.write_rttm(rttm_file)
-
-        lines = []
-        with open(output_rttm_path, 'r') as f:
-            lines = f.readlines()
-        with open(output_rttm_path, 'w') as f:
-            for line in lines:
-                parts = line.split(' ')
-                parts[1] = audio_filename # Replace placeholder file ID
-                f.write(' '.join(parts))
+            rttm_file.write("".join(lines))
         logger.info(f"Diarization results successfully written to {output_rttm_path}")
     except Exception as e:
         logger.error(f"Error writing to RTTM file: {e}")
 
+def _diarization_worker(worker_id: int, jobs: queue.Queue, results: dict, auth_token: str, min_speakers: Optional[int], max_speakers: Optional[int], clustering_threshold: Optional[float], output_dir: str, spectral_clustering: bool = False, cache: Optional[str] = None):
+    """Pulls (path, preprocessing future) jobs off the queue and diarizes them on one GPU."""
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.set_device(worker_id)
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        input_audio_path, preprocessed = job
+        audio_filename_base = os.path.splitext(os.path.basename(input_audio_path))[0]
+        try:
+            waveform, sr = preprocessed.result()
+            if waveform is None:
+                logger.error(f"Preprocessing failed for {input_audio_path}. Skipping.")
+                results[input_audio_path] = None
+                continue
+
+            diarization = run_diarization(
+                waveform,
+                sr,
+                min_speakers=min_speakers,
+                max_speakers=max_speakers,
+                clustering_threshold=clustering_threshold,
+                auth_token=auth_token,
+                spectral_clustering=spectral_clustering,
+                cache=cache
+            )
+            write_results_to_csv(diarization, os.path.join(output_dir, f"{audio_filename_base}_diarization.csv"))
+            write_rttm_file(diarization, os.path.join(output_dir, f"{audio_filename_base}_diarization.rttm"), audio_filename_base)
+            results[input_audio_path] = diarization
+        except (Exception, SystemExit) as e:
+            # initialize_pipeline exits on load failure; in a worker thread that would only end this thread.
+            logger.error(f"Diarization failed for {input_audio_path}: {e}")
+            results[input_audio_path] = None
+
+def diarize_batch(file_list, auth_token: str, min_speakers: Optional[int] = None, max_speakers: Optional[int] = None, clustering_threshold: Optional[float] = None, output_dir: str = 'outputs', num_workers: Optional[int] = None, spectral_clustering: bool = False, cache: Optional[str] = None):
+    """
+    Diarizes several audio files, one pipeline per GPU.
+
+    Preprocessing runs in a process pool and is prefetched through a bounded queue, so
+    file N+1 is being decoded and resampled while file N is on the GPU.
+
+    Args:
+        file_list (list): Paths to the input audio files. Repeated paths are diarized once.
+        auth_token (str): Hugging Face authentication token.
+        min_speakers (int, optional): Minimum number of speakers.
+        max_speakers (int, optional): Maximum number of speakers.
+        clustering_threshold (float, optional): Clustering threshold.
+        output_dir (str): Directory for the CSV and RTTM outputs.
+        num_workers (int, optional): Number of diarization workers. Defaults to the number of GPUs (1 on CPU).
+        spectral_clustering (bool): Use NME-SC spectral clustering (see `run_diarization`).
+        cache (str, optional): Cache directory for segmentation and embeddings.
+
+    Returns:
+        dict: Maps each input path to its Annotation, or None if it failed.
+    """
+    import torch
+    from preprocess import preprocess_audio
+
+    # Results are keyed by path, so a file listed twice is diarized (and written) once
+    unique_files = list(dict.fromkeys(file_list))
+    if len(unique_files) < len(file_list):
+        logger.warning(f"Ignoring {len(file_list) - len(unique_files)} duplicate input path(s).")
+    file_list = unique_files
+
+    if num_workers is None:
+        num_workers = max(1, torch.cuda.device_count())
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+    jobs = queue.Queue(maxsize=2 * num_workers)
+    workers = [
+        threading.Thread(
+            target=_diarization_worker,
+            args=(worker_id, jobs, results, auth_token, min_speakers, max_speakers, clustering_threshold, output_dir, spectral_clustering, cache),
+            daemon=True
+        )
+        for worker_id in range(num_workers)
+    ]
+
+    # The pool starts its processes lazily, while the worker threads already hold CUDA, OpenMP
+    # and logging state; spawned (not forked) children start from a clean interpreter.
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as preprocess_pool:
+        for worker in workers:
+            worker.start()
+        for input_audio_path in file_list:
+            # Blocks once the queue is full, which bounds how far preprocessing runs ahead
+            # CPU preprocessing: the GPUs belong to the diarization workers
+            jobs.put((input_audio_path, preprocess_pool.submit(preprocess_audio, input_audio_path, device='cpu')))
+        for _ in workers:
+            jobs.put(None)
+        for worker in workers:
+            worker.join()
+
+    logger.info(f"Batch diarization finished: {sum(r is not None for r in results.values())}/{len(file_list)} files succeeded.")
+    return results
+
 # --- Main Execution Block with argparse ---
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Run Speaker Diarization with pyannote.audio and configurable parameters.")
-    parser.add_argument("input_audio", type=str, help="Path to the input audio file.")
+    parser.add_argument("input_audio", type=str, nargs="*", help="Path to the input audio file. Several files are diarized as a batch.")
     parser.add_argument("--min_speakers", type=int, default=None, help="Minimum number of speakers.")
-    parser.add_argument("--max_speakers", type=int, default=None, help="Maximum number of speakers.")
+    parser.add_argument("--max_speakers", type=int, default=None, help="Maximum number of speakers (1 skips speaker embeddings).")
     parser.add_argument("--clustering_threshold", type=float, default=None, help="Clustering threshold (e.g., 0.7).")
     parser.add_argument("--auth_token", type=str, required=True, help="Hugging Face authentication token.")
+    parser.add_argument("--serve", action="store_true", help="Run as a persistent worker that keeps the pipeline loaded.")
+    parser.add_argument("--use_server", action="store_true", help="Send the audio to a running worker instead of loading the pipeline.")
+    parser.add_argument("--host", type=str, default=DEFAULT_SERVER_HOST, help="Worker host (for --serve / --use_server).")
+    parser.add_argument("--port", type=int, default=DEFAULT_SERVER_PORT, help="Worker port (for --serve / --use_server).")
+    parser.add_argument("--spectral_clustering", action="store_true", help="Use GPU NME-SC spectral clustering instead of the default agglomerative clustering.")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Cache segmentation and embeddings on disk (e.g. ~/.diar_cache) so reruns skip them. With --serve it applies to every request.")
+    parser.add_argument("--stream", action="store_true", help="Diarize the file in overlapping chunks instead of loading it whole.")
+    parser.add_argument("--chunk_seconds", type=int, default=600, help="Chunk length in seconds (for --stream).")
+    parser.add_argument("--overlap", type=int, default=10, help="Overlap between chunks in seconds (for --stream).")
 
     args = parser.parse_args()
 
+    if args.serve:
+        serve(args.auth_token, host=args.host, port=args.port, cache=args.cache_dir)
+        sys.exit(0)
+    if not args.input_audio:
+        parser.error("input_audio is required unless --serve is given.")
+    if args.use_server and args.cache_dir:
+        parser.error("--cache_dir is set on the worker: pass it to --serve instead of --use_server.")
+    if args.use_server and args.stream:
+        parser.error("--stream runs locally and cannot be combined with --use_server.")
+    if len(args.input_audio) > 1:
+        if args.use_server:
+            parser.error("--use_server takes a single input file.")
+        if args.stream:
+            parser.error("--stream takes a single input file.")
+        results = diarize_batch(
+            args.input_audio,
+            args.auth_token,
+            min_speakers=args.min_speakers,
+            max_speakers=args.max_speakers,
+            clustering_threshold=args.clustering_threshold,
+            spectral_clustering=args.spectral_clustering,
+            cache=args.cache_dir
+        )
+        sys.exit(0 if all(r is not None for r in results.values()) else 1)
+
+    from preprocess import preprocess_audio
+
     try:
-        input_audio_path = args.input_audio
+        input_audio_path = args.input_audio[0]
         output_dir = 'outputs'
         os.makedirs(output_dir, exist_ok=True)
 
@@ -119,17 +664,52 @@ if __name__ == '__main__':
         output_csv_path = os.path.join(output_dir, f"{audio_filename_base}_diarization.csv")
         output_rttm_path = os.path.join(output_dir, f"{audio_filename_base}_diarization.rttm")
 
-        processed_waveform, sample_rate = preprocess_audio(input_audio_path)
-
-        if processed_waveform is not None:
-            diarization = run_diarization(
-                processed_waveform,
-                sample_rate,
+        if args.stream:
+            diarization = stream_diarize(
+                input_audio_path,
+                auth_token=args.auth_token,
+                chunk_seconds=args.chunk_seconds,
+                overlap=args.overlap,
                 min_speakers=args.min_speakers,
                 max_speakers=args.max_speakers,
-                clustering_threshold=args.clustering_threshold, # Pass it to run_diarization
-                auth_token=args.auth_token
+                clustering_threshold=args.clustering_threshold,
+                spectral_clustering=args.spectral_clustering,
+                cache=args.cache_dir
             )
+            write_results_to_csv(diarization, output_csv_path)
+            write_rttm_file(diarization, output_rttm_path, audio_filename_base)
+            logger.info("\nDiarization complete.")
+            sys.exit(0)
+
+        processed_waveform, sample_rate = preprocess_audio(input_audio_path)
+
+        if processed_waveform is not None:
+            # pyannote is trained at 16 kHz; anything else would be resampled again inside the pipeline
+            assert processed_waveform.dtype == np.float32 and sample_rate == 16000, \
+                f"Expected 16 kHz float32 audio, got {sample_rate} Hz {processed_waveform.dtype}"
+            if args.use_server:
+                diarization = run_diarization_remote(
+                    processed_waveform,
+                    sample_rate,
+                    min_speakers=args.min_speakers,
+                    max_speakers=args.max_speakers,
+                    clustering_threshold=args.clustering_threshold,
+                    auth_token=args.auth_token,
+                    host=args.host,
+                    port=args.port,
+                    spectral_clustering=args.spectral_clustering
+                )
+            else:
+                diarization = run_diarization(
+                    processed_waveform,
+                    sample_rate,
+                    min_speakers=args.min_speakers,
+                    max_speakers=args.max_speakers,
+                    clustering_threshold=args.clustering_threshold, # Pass it to run_diarization
+                    auth_token=args.auth_token,
+                    spectral_clustering=args.spectral_clustering,
+                    cache=args.cache_dir
+                )
 
             write_results_to_csv(diarization, output_csv_path)
             write_rttm_file(diarization, output_rttm_path, audio_filename_base)
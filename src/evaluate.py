@@ -1,48 +1,242 @@
+import functools
 import json
 import os
+import re
 import sys
 import argparse
-from pyannote.core import Annotation, Segment
-from pyannote.metrics.diarization import DiarizationErrorRate
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, List, Tuple
+import numpy as np
 import logging
 
+# pyannote.core, pandas, scipy and pyannote.metrics are imported inside the functions that
+# use them, so `--help` and missing-file errors return before any of them load.
+if TYPE_CHECKING:
+    from pyannote.core import Annotation
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def read_rttm_to_annotation(file_path: str) -> Annotation:
+# Column layout of an RTTM "SPEAKER" line
+RTTM_COLUMNS = ["type", "file_id", "channel", "start", "duration", "ortho", "speaker_type", "speaker", "confidence", "lookahead"]
+
+# Captures the start, duration and speaker columns of every SPEAKER line
+_RTTM_SPEAKER_LINE = re.compile(rb"^[ \t]*SPEAKER[ \t]+\S+[ \t]+\S+[ \t]+(\S+)[ \t]+(\S+)[ \t]+\S+[ \t]+\S+[ \t]+(\S+)", re.M)
+
+def _parse_rttm_regex(file_path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    Reads an RTTM file and returns a pyannote.core.Annotation object.
+    Regex fallback for `load_rttm_fast` when pandas is not installed: one findall over the
+    whole file, with the numeric columns converted in bulk by NumPy.
+    """
+    with open(file_path, 'rb') as f:
+        rows = _RTTM_SPEAKER_LINE.findall(f.read())
+    if not rows:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64), np.empty(0, dtype=object)
+    columns = np.array(rows)
+    starts = columns[:, 0].astype(np.float64)
+    ends = starts + columns[:, 1].astype(np.float64)
+    speakers = np.array([label.decode() for label in columns[:, 2]], dtype=object)
+    return starts, ends, speakers
+
+def load_rttm_fast(file_path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reads the SPEAKER lines of an RTTM file into (starts, ends, labels) arrays.
+
+    The file is parsed in one pandas C-engine pass (or one regex pass when pandas is not
+    installed), without building Segment or Annotation objects; the arrays feed
+    `compute_der_components` directly. Zero-length turns are dropped.
 
     Args:
         file_path (str): Path to the RTTM file.
 
     Returns:
-        Annotation: The diarization annotation.
+        tuple: float64 start and end times in seconds, and the speaker label of each turn.
     """
-    uri = os.path.splitext(os.path.basename(file_path))[0]
-    annotation = Annotation(uri=uri)
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
 
     try:
-        with open(file_path, 'r') as f:
-            for line in f:
-                parts = line.strip().split()
-                if not parts or parts[0] != 'SPEAKER':
-                    continue
-
-                start_time = float(parts[3])
-                duration = float(parts[4])
-                speaker_id = parts[7]
-
-                segment = Segment(start_time, start_time + duration)
-                annotation[segment] = speaker_id  # Correct assignment syntax
+        if pd is None:
+            starts, ends, speakers = _parse_rttm_regex(file_path)
+        else:
+            try:
+                df = pd.read_csv(
+                    file_path,
+                    sep=r"\s+",
+                    header=None,
+                    names=RTTM_COLUMNS,
+                    usecols=["type", "start", "duration", "speaker"],
+                    dtype={"type": str, "speaker": str},
+                    # Labels such as "NA" or "null" are speaker names, not missing values
+                    keep_default_na=False,
+                    na_filter=False,
+                    engine="c"
+                )
+            except pd.errors.EmptyDataError:
+                return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64), np.empty(0, dtype=object)
+
+            df = df[df["type"] == "SPEAKER"]
+            starts = df["start"].to_numpy(np.float64)
+            ends = starts + df["duration"].to_numpy(np.float64)
+            speakers = df["speaker"].to_numpy()
     except Exception as e:
         logger.error(f"Error reading RTTM file '{file_path}': {e}")
         sys.exit(1)
 
+    keep = ends > starts
+    return starts[keep], ends[keep], speakers[keep]
+
+def read_rttm_to_annotation(file_path: str) -> "Annotation":
+    """
+    Reads an RTTM file and returns a pyannote.core.Annotation object.
+
+    Args:
+        file_path (str): Path to the RTTM file.
+
+    Returns:
+        Annotation: The diarization annotation.
+    """
+    from pyannote.core import Annotation, Segment
+
+    uri = os.path.splitext(os.path.basename(file_path))[0]
+    annotation = Annotation(uri=uri)
+    starts, ends, speakers = load_rttm_fast(file_path)
+
+    # Annotation.__setitem__ validates and invalidates caches on every assignment.
+    # Fill the track dict directly (same "_" track name it would use) and mark the
+    # timeline and labels as stale once at the end. The tracks live in a SortedDict: a
+    # single update() with pre-sorted (start, end) keys sorts once, not per insertion.
+    order = np.lexsort((ends, starts))
+    starts, ends, speakers = starts[order], ends[order], speakers[order]
+    annotation._tracks.update(zip(
+        map(Segment, starts.tolist(), ends.tolist()),
+        ({"_": speaker_id} for speaker_id in speakers)
+    ))
+    annotation._timelineNeedsUpdate = True
+    for speaker_id in set(speakers):
+        annotation._labelNeedsUpdate[speaker_id] = True
+
     return annotation
 
-def evaluate_diarization(reference_rttm_path: str, hypothesis_rttm_path: str, output_json_path: str = None):
+@functools.lru_cache(maxsize=16)
+def _load_rttm_cached(file_path: str, mtime_ns: int, size: int, as_intervals: bool):
+    """Parses an RTTM file once per (path, modification time, size, output format)."""
+    return load_rttm_fast(file_path) if as_intervals else read_rttm_to_annotation(file_path)
+
+def load_rttm(file_path: str, as_intervals: bool = False):
+    """
+    Returns the Annotation (or, with as_intervals=True, the `load_rttm_fast` arrays) of an
+    RTTM file, reusing the parse while the file is unchanged.
+
+    Repeated evaluations against the same reference (e.g. while tuning) skip re-parsing it.
+    The returned object is shared between calls and must not be modified.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        # Let the parser report the error
+        return load_rttm_fast(file_path) if as_intervals else read_rttm_to_annotation(file_path)
+    return _load_rttm_cached(file_path, stat.st_mtime_ns, stat.st_size, as_intervals)
+
+def annotation_to_intervals(annotation: "Annotation") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Flattens an Annotation into (starts, ends, labels) arrays, one entry per track.
+    """
+    starts, ends, labels = [], [], []
+    for segment, _, label in annotation.itertracks(yield_label=True):
+        starts.append(segment.start)
+        ends.append(segment.end)
+        labels.append(label)
+    return np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64), np.asarray(labels, dtype=str)
+
+def _interval_activity(boundaries: np.ndarray, starts: np.ndarray, ends: np.ndarray, label_ids: np.ndarray, num_labels: int) -> np.ndarray:
+    """
+    Counts the active intervals of each label on every elementary segment [boundaries[k], boundaries[k + 1]).
+
+    Each interval adds +1 at its start and -1 at its end; a cumulative sum sweeps the events.
+    """
+    events = np.zeros((num_labels, len(boundaries)), dtype=np.int32)
+    np.add.at(events, (label_ids, np.searchsorted(boundaries, starts)), 1)
+    np.add.at(events, (label_ids, np.searchsorted(boundaries, ends)), -1)
+    return np.cumsum(events, axis=1)[:, :-1]
+
+def compute_der_components(reference: Tuple[np.ndarray, np.ndarray, np.ndarray], hypothesis: Tuple[np.ndarray, np.ndarray, np.ndarray], collar: float = 0.0) -> dict:
+    """
+    Computes DER components directly on (starts, ends, labels) interval arrays.
+
+    Follows pyannote.metrics' DiarizationErrorRate with skip_overlap=False, scored on the
+    support of the reference: collars of `collar` seconds centred on reference boundaries are
+    removed, speakers are mapped one-to-one to maximize overlap, and errors are counted on the
+    elementary segments between consecutive boundaries. Cost grows with the number of segments,
+    not with the audio duration.
+
+    Args:
+        reference (tuple): (starts, ends, labels) arrays of the reference.
+        hypothesis (tuple): (starts, ends, labels) arrays of the hypothesis.
+        collar (float): Duration (in seconds) of the collars removed around reference boundaries.
+
+    Returns:
+        dict: The same keys as DiarizationErrorRate(detailed=True).
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    ref_starts, ref_ends, ref_labels = reference
+    hyp_starts, hyp_ends, hyp_labels = hypothesis
+    ref_names, ref_ids = np.unique(ref_labels, return_inverse=True)
+    hyp_names, hyp_ids = np.unique(hyp_labels, return_inverse=True)
+
+    # Collars are removed around every reference boundary
+    ref_bounds = np.concatenate([ref_starts, ref_ends])
+    collar_starts, collar_ends = ref_bounds - 0.5 * collar, ref_bounds + 0.5 * collar
+
+    boundaries = np.unique(np.concatenate([ref_starts, ref_ends, hyp_starts, hyp_ends, collar_starts, collar_ends]))
+    durations = np.diff(boundaries)
+
+    ref_active = _interval_activity(boundaries, ref_starts, ref_ends, ref_ids, len(ref_names))
+    hyp_active = _interval_activity(boundaries, hyp_starts, hyp_ends, hyp_ids, len(hyp_names))
+
+    # Score only the reference support, minus the collars
+    scored = ref_active.sum(axis=0) > 0
+    if collar > 0.0:
+        in_collar = _interval_activity(boundaries, collar_starts, collar_ends, np.zeros(len(collar_starts), dtype=np.int64), 1)[0] > 0
+        scored &= ~in_collar
+    durations = durations * scored
+
+    # One-to-one speaker mapping maximizing the total co-occurrence
+    cooccurrence = (ref_active * durations) @ hyp_active.T
+    correct_per_segment = np.zeros(len(durations))
+    if cooccurrence.size:
+        for r, h in zip(*linear_sum_assignment(cooccurrence, maximize=True)):
+            if cooccurrence[r, h] > 0:
+                correct_per_segment += np.minimum(ref_active[r], hyp_active[h])
+
+    num_ref = ref_active.sum(axis=0)
+    num_hyp = hyp_active.sum(axis=0)
+    total = float(durations @ num_ref)
+    correct = float(durations @ correct_per_segment)
+    missed = float(durations @ np.maximum(num_ref - num_hyp, 0))
+    false_alarm = float(durations @ np.maximum(num_hyp - num_ref, 0))
+    confusion = float(durations @ (np.minimum(num_ref, num_hyp) - correct_per_segment))
+
+    error = false_alarm + missed + confusion
+    if total > 0.0:
+        error_rate = error / total
+    else:
+        error_rate = 0.0 if error == 0.0 else 1.0
+
+    return {
+        "diarization error rate": error_rate,
+        "total": total,
+        "correct": correct,
+        "false alarm": false_alarm,
+        "missed detection": missed,
+        "confusion": confusion
+    }
+
+def evaluate_diarization(reference_rttm_path: str, hypothesis_rttm_path: str, output_json_path: str = None, collar: float = 0.0, strict: bool = False):
     """
     Computes Diarization Error Rate (DER) between reference and hypothesis RTTM files.
 
@@ -50,22 +244,40 @@ def evaluate_diarization(reference_rttm_path: str, hypothesis_rttm_path: str, ou
         reference_rttm_path (str): Path to ground truth RTTM file.
         hypothesis_rttm_path (str): Path to hypothesis RTTM file.
         output_json_path (str, optional): Path to save detailed DER results as JSON.
+        collar (float): Duration (in seconds) of the collars removed around reference boundaries.
+        strict (bool): Score with pyannote.metrics' DiarizationErrorRate instead of the
+            interval sweep in `compute_der_components`.
     """
+    # The interval sweep reads the RTTM columns as arrays; only --strict builds Annotations
     logger.info(f"Loading reference RTTM from: {reference_rttm_path}")
-    reference = read_rttm_to_annotation(reference_rttm_path)
+    reference = load_rttm(reference_rttm_path, as_intervals=not strict)
 
     logger.info(f"Loading hypothesis RTTM from: {hypothesis_rttm_path}")
-    hypothesis = read_rttm_to_annotation(hypothesis_rttm_path)
+    hypothesis = load_rttm(hypothesis_rttm_path, as_intervals=not strict)
+
+    if strict:
+        # Deferred so that `--help` and missing-file errors don't pay for pyannote.metrics
+        from pyannote.metrics.diarization import DiarizationErrorRate
 
-    der_metric = DiarizationErrorRate()
+        der_metric = DiarizationErrorRate(collar=collar, skip_overlap=False)
 
-    uem = reference.get_timeline()
-    der_components = der_metric(reference, hypothesis, uem=uem, detailed=True)
+        # Support of the reference timeline, built without the defensive copy
+        uem = reference.get_timeline(copy=False).support()
+        der_components = der_metric(reference, hypothesis, uem=uem, detailed=True)
+    else:
+        der_components = compute_der_components(reference, hypothesis, collar=collar)
 
     overall_der = der_components['diarization error rate']
 
+    # Report straight from the components of this single call; DiarizationErrorRate.report()
+    # would walk the accumulated results a second time.
     logger.info("\n--- Diarization Evaluation ---")
-    der_metric.report(display=True)
+    logger.info(
+        f"false alarm = {der_components['false alarm']:.2f}s, "
+        f"missed detection = {der_components['missed detection']:.2f}s, "
+        f"confusion = {der_components['confusion']:.2f}s, "
+        f"total = {der_components['total']:.2f}s"
+    )
     logger.info(f"Final DER = {overall_der * 100:.2f}%")
 
     json_output_data = {
@@ -74,6 +286,7 @@ def evaluate_diarization(reference_rttm_path: str, hypothesis_rttm_path: str, ou
         "components": {
             "false_alarm_seconds": round(der_components['false alarm'], 2),
             "missed_detection_seconds": round(der_components['missed detection'], 2),
+            "confusion_seconds": round(der_components['confusion'], 2),
             "total_speech_seconds": round(der_components['total'], 2)
         },
         "reference_file": reference_rttm_path,
@@ -89,11 +302,122 @@ def evaluate_diarization(reference_rttm_path: str, hypothesis_rttm_path: str, ou
         except Exception as e:
             logger.error(f"Error saving DER results to JSON: {e}")
 
+def pair_rttm_files(reference_dir: str, hypothesis_dir: str) -> List[Tuple[str, str]]:
+    """
+    Pairs each reference RTTM with its hypothesis by file name.
+
+    A reference 'X.rttm' matches a hypothesis named 'X_diarization.rttm' (as written by
+    diarize.py) or 'X.rttm'. References without a hypothesis are skipped with a warning.
+    """
+    pairs = []
+    for name in sorted(os.listdir(reference_dir)):
+        base, ext = os.path.splitext(name)
+        if ext != '.rttm':
+            continue
+        for candidate in (f"{base}_diarization.rttm", name):
+            hypothesis_path = os.path.join(hypothesis_dir, candidate)
+            if os.path.exists(hypothesis_path):
+                pairs.append((os.path.join(reference_dir, name), hypothesis_path))
+                break
+        else:
+            logger.warning(f"No hypothesis RTTM found for reference '{name}'. Skipping.")
+    return pairs
+
+def evaluate_corpus(pairs: List[Tuple[str, str]], output_json_path: str = None, collar: float = 0.0, strict: bool = False):
+    """
+    Computes per-file and pooled DER over a list of (reference, hypothesis) RTTM pairs.
+
+    Components are summed over every file, so the pooled DER is weighted by reference
+    speech duration. RTTM files are parsed in parallel.
+
+    Args:
+        pairs (list): (reference_rttm_path, hypothesis_rttm_path) tuples.
+        output_json_path (str, optional): Path to save the per-file and pooled results as JSON.
+        collar (float): Duration (in seconds) of the collars removed around reference boundaries.
+        strict (bool): Score with pyannote.metrics' DiarizationErrorRate (and print its report)
+            instead of the interval sweep in `compute_der_components`.
+    """
+    reference_paths = [reference for reference, _ in pairs]
+    hypothesis_paths = [hypothesis for _, hypothesis in pairs]
+
+    logger.info(f"Loading {len(pairs)} reference/hypothesis RTTM pairs...")
+    loader = read_rttm_to_annotation if strict else load_rttm_fast
+    with ProcessPoolExecutor() as pool:
+        references = list(pool.map(loader, reference_paths))
+        hypotheses = list(pool.map(loader, hypothesis_paths))
+
+    if strict:
+        from pyannote.metrics.diarization import DiarizationErrorRate
+
+        der_metric = DiarizationErrorRate(collar=collar, skip_overlap=False)
+
+    files = []
+    pooled = dict.fromkeys(["false alarm", "missed detection", "confusion", "total"], 0.0)
+    for reference_path, hypothesis_path, reference, hypothesis in zip(reference_paths, hypothesis_paths, references, hypotheses):
+        if strict:
+            uem = reference.get_timeline(copy=False).support()
+            der_components = der_metric(reference, hypothesis, uem=uem, detailed=True)
+        else:
+            der_components = compute_der_components(reference, hypothesis, collar=collar)
+        for key in pooled:
+            pooled[key] += der_components[key]
+        files.append({
+            "reference_file": reference_path,
+            "hypothesis_file": hypothesis_path,
+            "der_percentage": round(der_components['diarization error rate'] * 100, 2),
+            "components": {
+                "false_alarm_seconds": round(der_components['false alarm'], 2),
+                "missed_detection_seconds": round(der_components['missed detection'], 2),
+                "confusion_seconds": round(der_components['confusion'], 2),
+                "total_speech_seconds": round(der_components['total'], 2)
+            }
+        })
+
+    logger.info("\n--- Corpus Diarization Evaluation ---")
+    if strict:
+        der_metric.report(display=True)
+    else:
+        logger.info(
+            f"false alarm = {pooled['false alarm']:.2f}s, "
+            f"missed detection = {pooled['missed detection']:.2f}s, "
+            f"confusion = {pooled['confusion']:.2f}s, "
+            f"total = {pooled['total']:.2f}s"
+        )
+
+    pooled_error = pooled['false alarm'] + pooled['missed detection'] + pooled['confusion']
+    pooled_der = pooled_error / pooled['total'] if pooled['total'] > 0.0 else float(pooled_error > 0.0)
+    logger.info(f"Pooled DER over {len(files)} files = {pooled_der * 100:.2f}%")
+
+    json_output_data = {
+        "overall_der": pooled_der,
+        "der_percentage": round(pooled_der * 100, 2),
+        "components": {
+            "false_alarm_seconds": round(pooled['false alarm'], 2),
+            "missed_detection_seconds": round(pooled['missed detection'], 2),
+            "confusion_seconds": round(pooled['confusion'], 2),
+            "total_speech_seconds": round(pooled['total'], 2)
+        },
+        "files": files
+    }
+
+    if output_json_path:
+        try:
+            os.makedirs(os.path.dirname(output_json_path), exist_ok=True)
+            with open(output_json_path, 'w') as f:
+                json.dump(json_output_data, f, indent=4)
+            logger.info(f"Corpus DER results saved to JSON file: {output_json_path}")
+        except Exception as e:
+            logger.error(f"Error saving corpus DER results to JSON: {e}")
+
+    return json_output_data
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Evaluate speaker diarization using DER metric.")
-    parser.add_argument("reference_rttm", type=str, help="Path to ground truth RTTM file.")
-    parser.add_argument("hypothesis_rttm", type=str, help="Path to hypothesis RTTM file.")
+    parser.add_argument("reference_rttm", type=str, help="Path to ground truth RTTM file, or a directory of them.")
+    parser.add_argument("hypothesis_rttm", type=str, help="Path to hypothesis RTTM file, or a directory of them.")
     parser.add_argument("--output_json", type=str, default=None, help="Optional path to save detailed DER results as JSON.")
+    parser.add_argument("--collar", type=float, default=0.0, help="Collar (in seconds) removed around reference boundaries.")
+    parser.add_argument("--strict", action="store_true", help="Score with pyannote.metrics' DiarizationErrorRate instead of the faster interval sweep.")
 
     args = parser.parse_args()
 
@@ -106,7 +430,17 @@ if __name__ == '__main__':
         logger.error("Please run the diarization script first to generate hypothesis RTTM.")
         sys.exit(1)
 
-    evaluate_diarization(args.reference_rttm, args.hypothesis_rttm, args.output_json)
+    if os.path.isdir(args.reference_rttm) and os.path.isdir(args.hypothesis_rttm):
+        pairs = pair_rttm_files(args.reference_rttm, args.hypothesis_rttm)
+        if not pairs:
+            logger.error("No matching reference/hypothesis RTTM pairs found.")
+            sys.exit(1)
+        output_json = args.output_json or os.path.join(args.hypothesis_rttm, "corpus_der.json")
+        evaluate_corpus(pairs, output_json, collar=args.collar, strict=args.strict)
+        logger.info("Corpus evaluation complete.")
+        sys.exit(0)
+
+    evaluate_diarization(args.reference_rttm, args.hypothesis_rttm, args.output_json, collar=args.collar, strict=args.strict)
     logger.info("Evaluation complete.")
 
 
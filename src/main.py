@@ -4,12 +4,10 @@ import os
 import sys
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-# Since this script is inside 'src', we can directly import sibling modules.
-from preprocess import preprocess_audio
-from diarize import run_diarization, write_results_to_csv, write_rttm_file
-from visualize import plot_diarization, read_rttm_manual
-from evaluate import evaluate_diarization
+# The sibling modules (and through them torch, pyannote, matplotlib and librosa) are imported
+# inside full_pipeline, so `--help` and bad arguments return without the import cost.
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,6 +17,19 @@ def full_pipeline(args):
     """
     Runs the complete speaker diarization pipeline from preprocessing to evaluation.
     """
+    if not os.path.exists(args.input_audio):
+        logger.error(f"Input audio file not found: {args.input_audio}")
+        sys.exit(1)
+
+    # Since this script is inside 'src', we can directly import sibling modules.
+    from preprocess import preprocess_audio
+    from diarize import prepare_audio_input, run_diarization, write_results_to_csv, write_rttm_file
+    # The plot is only saved (from a worker thread), so use the non-interactive backend
+    import matplotlib
+    matplotlib.use('Agg')
+    from visualize import plot_diarization
+    from evaluate import evaluate_diarization
+
     logger.info(f"--- Starting Full Pipeline for: {args.input_audio} ---")
 
     # === Step 1: Preprocess Audio ===
@@ -30,34 +41,42 @@ def full_pipeline(args):
 
     # === Step 2: Run Diarization ===
     logger.info("Step 2: Running diarization...")
+    # One pinned device copy of the waveform, shared by every pipeline stage
+    audio_data = prepare_audio_input(waveform, sr)
     diarization = run_diarization(
         waveform,
         sr,
         min_speakers=args.min_speakers,
         max_speakers=args.max_speakers,
         clustering_threshold=args.clustering_threshold,
-        auth_token=args.auth_token
+        auth_token=args.auth_token,
+        audio_data=audio_data
     )
     logger.info("Diarization complete.")
 
-    # === Step 3: Save Outputs ===
+    # === Steps 3 & 4: Save Outputs and Visualize Results ===
+    # The CSV, RTTM and plot only read `diarization` and write distinct files, so they run
+    # concurrently: wall-clock is the slowest of the three rather than their sum.
     logger.info("Step 3: Saving diarization outputs...")
+    logger.info("Step 4: Generating visualization...")
     output_dir = 'outputs'
     os.makedirs(output_dir, exist_ok=True)
     audio_filename_base = os.path.splitext(os.path.basename(args.input_audio))[0]
     
     csv_path = os.path.join(output_dir, f"{audio_filename_base}_diarization.csv")
     rttm_path = os.path.join(output_dir, f"{audio_filename_base}_diarization.rttm")
-    
-    write_results_to_csv(diarization, csv_path)
-    write_rttm_file(diarization, rttm_path, audio_filename_base)
-    logger.info(f"Outputs saved to {output_dir}")
-
-    # === Step 4: Visualize Results ===
-    logger.info("Step 4: Generating visualization...")
     plot_dir = 'plots'
     plot_path = os.path.join(plot_dir, f"{audio_filename_base}_diarization.png")
-    plot_diarization(waveform, sr, diarization, output_png_path=plot_path)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(write_results_to_csv, diarization, csv_path),
+            executor.submit(write_rttm_file, diarization, rttm_path, audio_filename_base),
+            executor.submit(plot_diarization, waveform, sr, diarization, output_png_path=plot_path)
+        ]
+        for future in futures:
+            future.result()
+    logger.info(f"Outputs saved to {output_dir}")
     logger.info(f"Visualization saved to {plot_path}")
 
     # === Step 5: Evaluate (if reference RTTM exists) ===
@@ -76,7 +95,7 @@ if __name__ == '__main__':
     parser.add_argument("input_audio", type=str, help="Path to the input audio file.")
     parser.add_argument("--auth_token", type=str, required=True, help="Hugging Face authentication token.")
     parser.add_argument("--min_speakers", type=int, default=None, help="Minimum number of speakers.")
-    parser.add_argument("--max_speakers", type=int, default=None, help="Maximum number of speakers.")
+    parser.add_argument("--max_speakers", type=int, default=None, help="Maximum number of speakers (1 skips speaker embeddings).")
     parser.add_argument("--clustering_threshold", type=float, default=None, help="Clustering threshold.")
     
     args = parser.parse_args()
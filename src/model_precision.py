@@ -0,0 +1,101 @@
+import logging
+
+# Reduced-precision helpers shared by the diarization, VAD and overlap detection pipelines.
+# torch is imported inside the functions, so importing this module stays cheap.
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Feature front ends that stay in FP32 when a model is cast: PyanNet's SincNet filters the raw
+# waveform. WeSpeaker's fbank front end is a plain function, not a submodule, so it stays FP32
+# by construction.
+_FRONT_END_MODULES = ("sincnet",)
+
+def _cast_floats(value, dtype):
+    """Casts the floating point tensors in value (a tensor, or a tuple/list of them) to dtype."""
+    import torch
+
+    if torch.is_tensor(value):
+        return value.to(dtype) if value.is_floating_point() else value
+    if isinstance(value, (tuple, list)):
+        return type(value)(_cast_floats(v, dtype) for v in value)
+    return value
+
+def cast_model_to_half_precision(model, dtype) -> list:
+    """
+    Casts the backbone of a torch model to a reduced-precision dtype in place.
+
+    The feature front end (see `_FRONT_END_MODULES`) and the model inputs stay in FP32. Each
+    backbone layer casts its floating point inputs to dtype on the way in and its outputs back
+    to float32 on the way out, so the front end and pyannote's numpy post-processing are unaffected.
+
+    Args:
+        model: A torch model (a pyannote segmentation or embedding model).
+        dtype: Reduced-precision dtype, e.g. torch.bfloat16.
+
+    Returns:
+        list: The hook handles, for `restore_full_precision`.
+    """
+    import torch
+
+    def cast_inputs(module, args, kwargs):
+        return _cast_floats(args, dtype), {k: _cast_floats(v, dtype) for k, v in kwargs.items()}
+
+    def cast_outputs(module, args, output):
+        return _cast_floats(output, torch.float32)
+
+    handles = []
+    try:
+        for name, child in model.named_children():
+            if name in _FRONT_END_MODULES:
+                continue
+            # A ModuleList is never called itself; hook the layers it holds
+            layers = list(child) if isinstance(child, torch.nn.ModuleList) else [child]
+            for layer in layers:
+                layer.to(dtype)
+                handles.append(layer.register_forward_pre_hook(cast_inputs, with_kwargs=True))
+                handles.append(layer.register_forward_hook(cast_outputs))
+    except Exception:
+        # Never leave a half-cast model behind
+        restore_full_precision(model, handles)
+        raise
+    return handles
+
+def restore_full_precision(model, handles: list):
+    """
+    Undoes `cast_model_to_half_precision`: removes its hooks and casts the model back to FP32.
+
+    Args:
+        model: The model that was cast.
+        handles (list): The hook handles returned by `cast_model_to_half_precision`.
+    """
+    for handle in handles:
+        handle.remove()
+    model.float()
+
+def reduce_segmentation_precision(pipeline, device: str):
+    """
+    Runs the segmentation model of a detection pipeline (VAD, overlap detection) at reduced precision.
+
+    On CUDA the model backbone is cast to bfloat16 (float16 where bf16 is unsupported); on CPU its
+    LSTM and Linear layers are dynamically quantized to INT8. If this fails, the model is
+    left in FP32.
+
+    Args:
+        pipeline: A pyannote pipeline with a `_segmentation` inference.
+        device (str): Device the pipeline runs on.
+    """
+    import torch
+
+    model = pipeline._segmentation.model
+    try:
+        if device.startswith("cuda"):
+            dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            cast_model_to_half_precision(model, dtype)
+            logger.info(f"Segmentation model cast to {dtype}.")
+        else:
+            torch.quantization.quantize_dynamic(model, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            logger.info("Segmentation model dynamically quantized to INT8.")
+    except Exception as e:
+        logger.warning(f"Could not reduce segmentation model precision, keeping FP32: {e}")
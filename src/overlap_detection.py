@@ -1,44 +1,106 @@
+import functools
+import logging
+import threading
 import torch
 from pyannote.audio import Pipeline
+import numpy as np
+import soundfile as sf
+from pipeline_cache import audio_fingerprint, cached_pipeline
+from model_precision import reduce_segmentation_precision
+from chunked_inference import DEFAULT_CHUNK_SECONDS, DEFAULT_OVERLAP_SECONDS, detect_in_chunks, iter_array_chunks, iter_file_chunks
 
-def detect_overlaps(audio_path, hf_token):
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Pretrained pipeline used for overlapped speech detection
+OVERLAP_MODEL = "pyannote/overlapped-speech-detection"
+
+# Guards the first construction of a pipeline when called from several threads
+_PIPELINE_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize=4)
+def _load_overlap_pipeline(hf_token, device):
+    logger.info("Loading overlapped speech detection pipeline...")
+    pipeline = Pipeline.from_pretrained(
+        OVERLAP_MODEL,
+        use_auth_token=hf_token
+    )
+    pipeline.to(torch.device(device))
+    reduce_segmentation_precision(pipeline, device)
+    logger.info("Pipeline loaded.")
+    return pipeline
+
+def _get_overlap_pipeline(hf_token, device=None):
+    """Returns the overlap detection pipeline for (hf_token, device), loading it only on first use."""
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    with _PIPELINE_LOCK:
+        return _load_overlap_pipeline(hf_token, device)
+
+def detect_overlaps(audio_path, hf_token, cache=None, chunk_seconds=DEFAULT_CHUNK_SECONDS, overlap_seconds=DEFAULT_OVERLAP_SECONDS):
     """
     Detect overlapping speech regions in an audio file.
 
+    The file is streamed in chunks of chunk_seconds that overlap by overlap_seconds, so only
+    one chunk is held in memory at a time (see chunked_inference.py). Formats libsndfile can't
+    open are decoded whole with preprocess_audio and chunked in memory instead.
+
     Args:
         audio_path (str): Path to audio file.
         hf_token (str): Hugging Face access token.
+        cache (str, optional): Directory for caching results of identical runs on disk.
+        chunk_seconds (float): Length of each chunk, in seconds.
+        overlap_seconds (float): Overlap between consecutive chunks, in seconds.
 
     Returns:
         list of tuples: Each tuple is (start_time, end_time) of overlap.
     """
-    print("Loading overlapped speech detection pipeline...")
-    pipeline = Pipeline.from_pretrained(
-        "pyannote/overlapped-speech-detection",
-        use_auth_token=hf_token
-    )
-    if torch.cuda.is_available():
-        pipeline.to("cuda")
-    print("Pipeline loaded. Processing audio...")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    pipeline = _get_overlap_pipeline(hf_token, device)
+    logger.info("Processing audio...")
 
-    # Run pipeline on audio file path
-    output = pipeline(audio_path)
+    # Chunk lengths are in samples at the file's own rate; the pipeline resamples each chunk
+    try:
+        sr = sf.info(audio_path).samplerate
+        waveform = None
+    except Exception as e:
+        # Formats libsndfile can't open (m4a, mp3, ...) are decoded whole, as for VAD
+        from preprocess import preprocess_audio
+
+        logger.info(f"libsndfile can't stream '{audio_path}', decoding it instead: {e}")
+        waveform, sr = preprocess_audio(audio_path)
+        if waveform is None:
+            logger.error(f"Audio preprocessing failed for '{audio_path}'.")
+            return []
+    chunk_samples = int(chunk_seconds * sr)
+    overlap_samples = int(overlap_seconds * sr)
+    if waveform is None:
+        chunks = iter_file_chunks(audio_path, chunk_samples, overlap_samples)
+    else:
+        chunks = iter_array_chunks(np.ascontiguousarray(waveform, dtype=np.float32), chunk_samples, overlap_samples)
+    run_chunks = functools.partial(detect_in_chunks, pipeline, sr=sr, chunk_samples=chunk_samples, overlap_samples=overlap_samples, device=device)
+
+    fingerprint = audio_fingerprint(audio_path) if cache is not None else None
+    regions = cached_pipeline(
+        run_chunks, chunks, cache, OVERLAP_MODEL, fingerprint,
+        key_params={"chunk_seconds": chunk_seconds, "overlap_seconds": overlap_seconds}
+    )
 
-    # Get timeline of overlapping speech regions
-    overlap_segments = []
-    for segment in output.get_timeline().support():
-        overlap_segments.append((segment.start, segment.end))
-        print(f"Overlap detected from {segment.start:.2f}s to {segment.end:.2f}s")
+    # Merged overlapping speech regions
+    overlap_segments = [(start, end) for start, end in regions.tolist()]
+    for start, end in overlap_segments:
+        logger.info(f"Overlap detected from {start:.2f}s to {end:.2f}s")
 
     return overlap_segments
 
 if __name__ == "__main__":
     import sys
     if len(sys.argv) < 3:
-        print("Usage: python overlap_detection.py <audio_path> <hf_token>")
+        logger.error("Usage: python overlap_detection.py <audio_path> <hf_token>")
         sys.exit(1)
 
     audio_file = sys.argv[1]
     token = sys.argv[2]
     overlaps = detect_overlaps(audio_file, token)
-    print(f"\nTotal overlapping segments detected: {len(overlaps)}")
+    logger.info(f"Total overlapping segments detected: {len(overlaps)}")
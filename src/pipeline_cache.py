@@ -0,0 +1,177 @@
+import hashlib
+import os
+import pickle
+import logging
+import numpy as np
+from typing import Optional, Union
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default location for cached pipeline outputs
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".diar_cache")
+
+def audio_fingerprint(audio: Union[str, np.ndarray], sample_rate: Optional[int] = None) -> str:
+    """
+    Returns a blake2b fingerprint of a waveform array (plus its sample rate) or of an audio file's bytes.
+
+    Args:
+        audio (str or np.ndarray): Path to an audio file, or a waveform.
+        sample_rate (int, optional): Sample rate of the waveform.
+
+    Returns:
+        str: Hex digest identifying the audio.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    if isinstance(audio, (str, os.PathLike)):
+        with open(audio, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    else:
+        h.update(np.ascontiguousarray(audio))
+        h.update(str(sample_rate).encode())
+    return h.hexdigest()
+
+def _cache_path(cache: Union[str, os.PathLike], key_source: str) -> str:
+    """Returns the cache file path for a key description."""
+    key = hashlib.blake2b(key_source.encode(), digest_size=20).hexdigest()
+    return os.path.join(cache, f"{key}.pkl")
+
+def _load_pickle(cache_path: str):
+    """Returns the object pickled at cache_path, or None if it is missing or unreadable."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read cache file {cache_path}, recomputing: {e}")
+        return None
+
+def _dump_pickle(obj, cache_path: str) -> bool:
+    """Pickles obj to cache_path, logging (not raising) on failure. Returns whether it was written."""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            pickle.dump(obj, f)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not write cache file {cache_path}: {e}")
+        return False
+
+def cached_pipeline(pipeline, audio_data, cache: Optional[Union[str, os.PathLike]], model_name: str, fingerprint: str, key_params: Optional[dict] = None, **call_kwargs):
+    """
+    Calls `pipeline(audio_data, **call_kwargs)`, memoizing the output on disk.
+
+    This is a result cache: only an identical run is served from it. For speaker diarization
+    sweeps over clustering settings, use `cached_diarization`, which caches the segmentation
+    and embeddings instead. The cache key covers the audio fingerprint, the model name, the installed pyannote.audio
+    version, the call arguments and any extra `key_params` that change the output (for
+    example a clustering threshold set on the pipeline), so a cached result is only reused
+    for an identical run.
+
+    Args:
+        pipeline: The pyannote pipeline to call.
+        audio_data: The pipeline input (file path or {"waveform", "sample_rate"} dict).
+        cache (str, optional): Cache directory. None disables caching.
+        model_name (str): Name of the pretrained pipeline.
+        fingerprint (str): Audio fingerprint from `audio_fingerprint`.
+        key_params (dict, optional): Extra settings that affect the output.
+        **call_kwargs: Keyword arguments forwarded to the pipeline.
+
+    Returns:
+        The pipeline output.
+    """
+    if cache is None:
+        return pipeline(audio_data, **call_kwargs)
+
+    from pyannote.audio import __version__ as pyannote_version
+
+    key_source = repr((fingerprint, model_name, pyannote_version, sorted(call_kwargs.items()), sorted((key_params or {}).items())))
+    cache_path = _cache_path(cache, key_source)
+
+    output = _load_pickle(cache_path)
+    if output is not None:
+        logger.info(f"Loaded cached {model_name} output from {cache_path}")
+        return output
+
+    output = pipeline(audio_data, **call_kwargs)
+    if _dump_pickle(output, cache_path):
+        logger.info(f"Cached {model_name} output to {cache_path}")
+    return output
+
+# Keys under which pyannote's SpeakerDiarization looks up reusable intermediates in the input
+# file while `pipeline.training` is set (the mechanism it uses for hyper-parameter tuning)
+_SEGMENTATION_KEY = "training_cache/segmentation"
+_EMBEDDINGS_KEY = "training_cache/embeddings"
+
+def cached_diarization(pipeline, audio_data: dict, cache: Optional[Union[str, os.PathLike]], model_name: str, fingerprint: str, key_params: Optional[dict] = None, **call_kwargs):
+    """
+    Runs a pyannote speaker diarization pipeline, reusing its segmentation and embeddings from disk.
+
+    Segmentation and per-chunk speaker embedding extraction are the expensive steps and do not
+    depend on the clustering settings or the number of speakers, so they are cached keyed only
+    on the audio fingerprint, the model name, the pyannote.audio version and `key_params`
+    (settings that change them, e.g. the model precision). A sweep over clustering thresholds,
+    clustering methods or speaker counts then reruns only clustering and reconstruction.
+
+    The cached intermediates are handed to the pipeline through the "training_cache/*" file
+    keys it consults in training mode; freshly computed ones are captured with its step hook.
+
+    Args:
+        pipeline: A pyannote SpeakerDiarization pipeline.
+        audio_data (dict): The {"waveform", "sample_rate"} pipeline input.
+        cache (str, optional): Cache directory. None disables caching.
+        model_name (str): Name of the pretrained pipeline.
+        fingerprint (str): Audio fingerprint from `audio_fingerprint`.
+        key_params (dict, optional): Extra settings that affect segmentation or embeddings.
+        **call_kwargs: Keyword arguments forwarded to the pipeline (min_speakers, ...).
+
+    Returns:
+        The pipeline output.
+    """
+    if cache is None:
+        return pipeline(audio_data, **call_kwargs)
+
+    from pyannote.audio import __version__ as pyannote_version
+
+    key_source = repr((fingerprint, model_name, pyannote_version, "intermediates", sorted((key_params or {}).items())))
+    cache_path = _cache_path(cache, key_source)
+    cached = _load_pickle(cache_path) or {}
+    if cached:
+        logger.info(f"Reusing cached {model_name} {' and '.join(sorted(cached))} from {cache_path}")
+
+    computed = {}
+
+    def capture_step(step_name, step_artefact, file=None, total=None, completed=None):
+        # Progress calls carry total/completed; the final call of a step has the whole artefact
+        if completed is None and step_artefact is not None and step_name in ("segmentation", "embeddings"):
+            computed[step_name] = step_artefact
+
+    file = dict(audio_data)
+    if "segmentation" in cached:
+        file[_SEGMENTATION_KEY] = cached["segmentation"]
+    if "embeddings" in cached:
+        file[_EMBEDDINGS_KEY] = cached["embeddings"]
+
+    was_training = pipeline.training
+    pipeline.training = True
+    try:
+        output = pipeline(file, hook=capture_step, **call_kwargs)
+    finally:
+        pipeline.training = was_training
+
+    updated = dict(cached)
+    if "segmentation" not in cached and "segmentation" in computed:
+        updated["segmentation"] = computed["segmentation"]
+    if "embeddings" not in cached and "embeddings" in computed:
+        # Same layout pyannote stores; the threshold only matters for non-powerset segmentation
+        entry = {"embeddings": computed["embeddings"]}
+        threshold = getattr(getattr(pipeline, "segmentation", None), "threshold", None)
+        if threshold is not None:
+            entry["segmentation.threshold"] = threshold
+        updated["embeddings"] = entry
+    if len(updated) > len(cached) and _dump_pickle(updated, cache_path):
+        logger.info(f"Cached {model_name} {' and '.join(sorted(set(updated) - set(cached)))} to {cache_path}")
+    return output
@@ -1,6 +1,11 @@
 import librosa
 import numpy as np
 import soundfile as sf
+import torch
+import torchaudio
+import functools
+import hashlib
+import math
 import os
 import logging
 from typing import Tuple, Optional # Import necessary types
@@ -15,6 +20,8 @@ def rms_normalize(audio: np.ndarray, target_level: float = 0.1) -> np.ndarray:
     """
     Normalize audio to a target RMS level.
 
+    The input is scaled in place when it is already a contiguous float32 array.
+
     Args:
         audio (np.ndarray): Input waveform.
         target_level (float): Desired RMS amplitude (e.g., 0.1).
@@ -22,48 +29,116 @@ def rms_normalize(audio: np.ndarray, target_level: float = 0.1) -> np.ndarray:
     Returns:
         np.ndarray: RMS-normalized audio.
     """
-    rms = np.sqrt(np.mean(audio**2))
+    # Contiguous float32 so np.dot dispatches to a single BLAS sdot, with no squared temporary
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    rms = math.sqrt(float(np.dot(audio, audio)) / audio.size) if audio.size else 0.0
     # Use a small epsilon to prevent division by near-zero RMS
     if rms < 1e-8: # Added a small threshold
         logger.warning("RMS of audio is very close to zero, skipping normalization.")
         return audio
-    return audio * (target_level / rms)
+    np.multiply(audio, target_level / rms, out=audio)
+    return audio
+
+@functools.lru_cache(maxsize=8)
+def _get_resampler(orig_sr: int, target_sr: int, device: str = 'cpu') -> torchaudio.transforms.Resample:
+    """
+    Returns a polyphase resampler for (orig_sr, target_sr) on `device`, building its sinc kernel only once.
+    """
+    return torchaudio.transforms.Resample(
+        orig_sr,
+        target_sr,
+        lowpass_filter_width=16,
+        resampling_method='sinc_interp_kaiser'
+    ).to(device)
 
-def preprocess_audio(file_path: str, target_sr: int = 16000) -> Tuple[Optional[np.ndarray], Optional[int]]:
+def _preprocess_on_device(waveform: np.ndarray, sr: int, target_sr: int, device: str, target_level: float = 0.1) -> np.ndarray:
+    """
+    Downmixes, resamples and RMS-normalizes a decoded waveform in one torch chain on `device`.
+
+    The waveform is copied to the device once and only comes back at the end, instead of
+    making three full passes over host memory.
+    """
+    x = torch.from_numpy(np.ascontiguousarray(waveform)).to(device, non_blocking=True)
+    if x.ndim > 1:
+        x = x.T.mean(0) # soundfile is channels-last
+    if sr != target_sr:
+        x = _get_resampler(sr, target_sr, device)(x)
+    # One fused norm reduction (no squared temporary), then scale in place
+    rms = (torch.linalg.vector_norm(x) / math.sqrt(x.numel())).item() if x.numel() else 0.0
+    if rms < 1e-8:
+        logger.warning("RMS of audio is very close to zero, skipping normalization.")
+    else:
+        x.mul_(target_level / rms)
+    return x.cpu().numpy()
+
+def preprocess_audio(file_path: str, target_sr: int = 16000, device: Optional[str] = None, offset: float = 0.0, duration: Optional[float] = None) -> Tuple[Optional[np.ndarray], Optional[int]]:
     """
     Loads, resamples, and RMS-normalizes an audio file.
 
     Args:
         file_path (str): Path to the input audio file.
         target_sr (int): The target sample rate.
+        device (str, optional): Where to run downmix/resample/normalize. Defaults to CUDA when
+                                available; on 'cpu' the NumPy path is used.
+        offset (float): Start reading this many seconds into the file.
+        duration (float, optional): Only read this many seconds. Defaults to the rest of the file.
 
     Returns:
         Tuple[Optional[np.ndarray], Optional[int]]: The preprocessed audio waveform and sample rate.
                                                      Returns (None, None) if an error occurs.
     """
     try:
-        # Loading the file using the Librosa library
-        waveform, sr = librosa.load(file_path, sr=None, mono=False)
-    except Exception as e:
-        logger.error(f"Error loading {file_path}: {e}") # Use logger.error for errors
-        return None, None
+        # Decode straight to float32 with libsndfile; shape is (frames,) or (frames, channels).
+        # A partial read seeks to the offset and decodes only the requested frames.
+        if offset or duration is not None:
+            file_sr = sf.info(file_path).samplerate
+            start = int(round(offset * file_sr))
+            frames = int(round(duration * file_sr)) if duration is not None else -1
+            waveform, sr = sf.read(file_path, start=start, frames=frames, dtype='float32', always_2d=False)
+        else:
+            waveform, sr = sf.read(file_path, dtype='float32', always_2d=False)
+    except Exception:
+        try:
+            # Fall back to Librosa (audioread) for containers libsndfile can't decode
+            waveform, sr = librosa.load(file_path, sr=None, mono=False, offset=offset, duration=duration)
+            waveform = waveform.T # Librosa is channels-first
+        except Exception as e:
+            logger.error(f"Error loading {file_path}: {e}") # Use logger.error for errors
+            return None, None
 
-    # 1. Convert to mono by averaging channels if it's stereo
-    if waveform.ndim > 1:
-        waveform = np.mean(waveform, axis=0)
-        logger.info(f"Converted stereo audio to mono for {os.path.basename(file_path)}")
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
-    # 2. Resample to the target sample rate if necessary
-    if sr != target_sr:
-        waveform = librosa.resample(waveform, orig_sr=sr, target_sr=target_sr)
+    if device != 'cpu':
+        # Steps 1-3 fused into a single torch chain on the GPU
+        waveform = _preprocess_on_device(waveform, sr, target_sr, device, target_level=0.1)
         sr = target_sr
-        logger.info(f"Resampled {os.path.basename(file_path)} to {target_sr} Hz.")
+        logger.info(f"Downmixed, resampled and RMS normalized {os.path.basename(file_path)} on {device}.")
+    else:
+        # 1. Convert to mono by averaging channels if it's stereo
+        if waveform.ndim > 1:
+            if waveform.shape[1] == 2:
+                # Half-sum into one float32 buffer: a single read of the (channels-last) stereo
+                # frames, with no float64 accumulator or extra temporary
+                mono = np.empty(waveform.shape[0], dtype=np.float32)
+                np.add(waveform[:, 0], waveform[:, 1], out=mono)
+                np.multiply(mono, 0.5, out=mono)
+                waveform = mono
+            else:
+                waveform = np.mean(waveform, axis=1, dtype=np.float32)
+            logger.info(f"Converted stereo audio to mono for {os.path.basename(file_path)}")
+
+        # 2. Resample to the target sample rate if necessary, reusing the cached kernel for this rate pair
+        if sr != target_sr:
+            waveform = _get_resampler(sr, target_sr)(torch.from_numpy(np.ascontiguousarray(waveform))).numpy()
+            sr = target_sr
+            logger.info(f"Resampled {os.path.basename(file_path)} to {target_sr} Hz.")
 
-    # 3. Normalize using RMS loudness normalization
-    waveform = rms_normalize(waveform, target_level=0.1)
-    logger.info(f"RMS normalized {os.path.basename(file_path)}.")
+        # 3. Normalize using RMS loudness normalization
+        waveform = rms_normalize(waveform, target_level=0.1)
+        logger.info(f"RMS normalized {os.path.basename(file_path)}.")
 
-    duration = librosa.get_duration(y=waveform, sr=sr)
+    duration = len(waveform) / sr
     logger.info(f"Preprocessed {os.path.basename(file_path)}. Duration: {duration:.2f}s") # Use logger.info for general info
 
     try:
@@ -82,6 +157,130 @@ def preprocess_audio(file_path: str, target_sr: int = 16000) -> Tuple[Optional[n
     # The function still returns the in-memory waveform and sample rate as before
     return waveform, sr
 
+def preprocess_audio_cached(file_path: str, target_sr: int = 16000, cache_dir: Optional[str] = None, device: Optional[str] = None) -> Tuple[Optional[np.ndarray], Optional[int]]:
+    """
+    Like `preprocess_audio`, but memoizes the result on disk as a .npy file.
+
+    The cache key covers the file's absolute path, modification time, size, target_sr and the
+    preprocessing device (the CPU and GPU paths give slightly different samples), so editing
+    the audio invalidates it. Cached waveforms are memory-mapped read-only, so even long files
+    are not read into RAM up front; copy one before modifying it or handing it to torch.
+
+    Args:
+        file_path (str): Path to the input audio file.
+        target_sr (int): The target sample rate.
+        cache_dir (str, optional): Cache directory. Defaults to a "waveforms" folder under
+                                   pipeline_cache.DEFAULT_CACHE_DIR.
+        device (str, optional): Preprocessing device, as in `preprocess_audio`.
+
+    Returns:
+        Tuple[Optional[np.ndarray], Optional[int]]: The preprocessed (read-only) waveform and sample rate.
+    """
+    from pipeline_cache import DEFAULT_CACHE_DIR
+
+    cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, "waveforms")
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return preprocess_audio(file_path, target_sr=target_sr, device=device)
+    key_source = f"{os.path.abspath(file_path)}:{stat.st_mtime_ns}:{stat.st_size}:{target_sr}:{device}"
+    cache_path = os.path.join(cache_dir, hashlib.blake2b(key_source.encode(), digest_size=20).hexdigest() + ".npy")
+
+    if os.path.exists(cache_path):
+        try:
+            waveform = np.load(cache_path, mmap_mode='r')
+            logger.info(f"Loaded preprocessed {os.path.basename(file_path)} from cache {cache_path}")
+            return waveform, target_sr
+        except Exception as e:
+            logger.warning(f"Could not read cached waveform {cache_path}, recomputing: {e}")
+
+    waveform, sr = preprocess_audio(file_path, target_sr=target_sr, device=device)
+    if waveform is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary name and rename, so a concurrent reader never sees a partial file
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, waveform)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            logger.warning(f"Could not cache preprocessed waveform to {cache_path}: {e}")
+    return waveform, sr
+
+def _downmix_block(block: np.ndarray) -> np.ndarray:
+    """Downmixes a (frames, channels) float32 block to mono, half-summing stereo in place of a mean."""
+    if block.shape[1] == 1:
+        return block[:, 0]
+    if block.shape[1] == 2:
+        mono = np.add(block[:, 0], block[:, 1])
+        np.multiply(mono, 0.5, out=mono)
+        return mono
+    return np.mean(block, axis=1, dtype=np.float32)
+
+def preprocess_audio_stream(file_path: str, target_sr: int = 16000, blocksize: int = 1 << 20, target_level: float = 0.1):
+    """
+    Streams a preprocessed (mono, resampled, RMS-normalized) audio file block by block.
+
+    Decodes with soundfile.blocks, so memory stays bounded by one block instead of the whole
+    file. Normalization takes two passes: the first downmixes and resamples with a stateful
+    soxr stream (no seams between blocks) and accumulates the sum of squares of the resampled
+    signal, so the RMS matches `preprocess_audio`'s; the second repeats the downmix and
+    resampling, scales and yields. `diarize.stream_diarize` regroups the blocks into
+    overlapping chunks with chunked_inference.iter_stream_chunks, so `--stream` matches the
+    whole-file path's downmix and RMS gain. The resampler differs (soxr here, torchaudio in
+    `preprocess_audio`), so the samples are close but not identical.
+
+    Args:
+        file_path (str): Path to the input audio file.
+        target_sr (int): The target sample rate.
+        blocksize (int): Number of frames decoded per block.
+        target_level (float): Desired RMS amplitude.
+
+    Yields:
+        Tuple[np.ndarray, int]: A float32 mono block and its sample rate (target_sr).
+    """
+    import soxr
+
+    def resampled_blocks(sr):
+        resampler = soxr.ResampleStream(sr, target_sr, 1, dtype='float32') if sr != target_sr else None
+        for block in sf.blocks(file_path, blocksize=blocksize, dtype='float32', always_2d=True):
+            mono = _downmix_block(block)
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono)
+            if mono.size:
+                yield mono
+        if resampler is not None:
+            # Flush the samples still held in the resampler's filter state
+            tail = resampler.resample_chunk(np.empty(0, dtype=np.float32), last=True)
+            if tail.size:
+                yield tail
+
+    try:
+        sr = sf.info(file_path).samplerate
+
+        # Pass 1: RMS of the mono, resampled signal
+        sum_squares, num_samples = 0.0, 0
+        for mono in resampled_blocks(sr):
+            sum_squares += float(np.dot(mono, mono))
+            num_samples += mono.size
+    except Exception as e:
+        logger.error(f"Error loading {file_path}: {e}")
+        return
+
+    rms = math.sqrt(sum_squares / num_samples) if num_samples else 0.0
+    if rms < 1e-8:
+        logger.warning("RMS of audio is very close to zero, skipping normalization.")
+        gain = 1.0
+    else:
+        gain = target_level / rms
+
+    # Pass 2: downmix, resample, scale and stream out
+    for mono in resampled_blocks(sr):
+        yield np.multiply(mono, gain, dtype=np.float32), target_sr
+
+    logger.info(f"Streamed {os.path.basename(file_path)}. Duration: {num_samples / target_sr:.2f}s")
+
 # --- Example Usage ---
 if __name__ == '__main__':
     # Place an example audio file in your 'data' folder
@@ -2,13 +2,14 @@ import os
 import sys
 import argparse # Import argparse for better argument handling
 import logging # For consistent logging
+import numpy as np
 
 # Configure logging for this module
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Import necessary functions from your existing modules
-from preprocess import preprocess_audio
+# preprocess (torch, torchaudio, librosa) is imported inside run_speaker_change_detection,
+# after the input file has been checked; diarize defers its own heavy imports.
 from diarize import run_diarization, write_results_to_csv, write_rttm_file
 
 def run_speaker_change_detection(input_audio_path: str, auth_token: str, min_speakers: int = None, max_speakers: int = None, clustering_threshold: float = None):
@@ -26,6 +27,9 @@ def run_speaker_change_detection(input_audio_path: str, auth_token: str, min_spe
         logger.error(f"Error: Audio file not found at '{input_audio_path}'")
         return
 
+    # Import necessary functions from your existing modules
+    from preprocess import preprocess_audio
+
     # Create an 'outputs' directory if it doesn't exist
     output_dir = 'outputs'
     os.makedirs(output_dir, exist_ok=True)
@@ -60,15 +64,20 @@ def run_speaker_change_detection(input_audio_path: str, auth_token: str, min_spe
 
         # 4. Highlight Speaker Change Points
         logger.info("\n--- Speaker Change Points Detected ---")
-        previous_speaker = None
-
-        # Iterate through the diarization results to find change points
-        for i, (turn, _, speaker) in enumerate(diarization.itertracks(yield_label=True)):
-            if i == 0:
-                logger.info(f"Audio starts with speaker: {speaker} at {turn.start:.2f}s")
-            elif speaker != previous_speaker:
-                logger.info(f"Change detected at {turn.start:.2f}s: from {previous_speaker} to {speaker}")
-            previous_speaker = speaker
+        turns = list(diarization.itertracks(yield_label=True))
+        if turns:
+            # Map labels to integer codes once; a change is wherever consecutive codes differ
+            starts = np.fromiter((turn.start for turn, _, _ in turns), dtype=np.float64, count=len(turns))
+            labels = np.array([speaker for _, _, speaker in turns])
+            _, codes = np.unique(labels, return_inverse=True)
+            change_idx = np.flatnonzero(np.diff(codes) != 0) + 1
+
+            lines = [f"Audio starts with speaker: {labels[0]} at {starts[0]:.2f}s"]
+            lines.extend(
+                f"Change detected at {starts[i]:.2f}s: from {labels[i - 1]} to {labels[i]}"
+                for i in change_idx.tolist()
+            )
+            logger.info("\n".join(lines))
         logger.info("------------------------------------")
 
     except Exception as e:
@@ -86,7 +95,7 @@ if __name__ == '__main__':
     parser.add_argument("--min_speakers", type=int, default=None,
                         help="Minimum number of speakers expected (passed to diarization).")
     parser.add_argument("--max_speakers", type=int, default=None,
-                        help="Maximum number of speakers expected (passed to diarization).")
+                        help="Maximum number of speakers expected (passed to diarization; 1 skips speaker embeddings).")
     parser.add_argument("--clustering_threshold", type=float, default=None,
                         help="Threshold for clustering embeddings (passed to diarization).")
 
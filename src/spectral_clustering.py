@@ -0,0 +1,98 @@
+import torch
+import torch.nn.functional as F
+import numpy as np
+from sklearn.cluster import KMeans
+from pyannote.audio.pipelines.clustering import BaseClustering
+import logging
+from typing import Optional
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class NMESCClustering(BaseClustering):
+    """
+    Normalized Maximum Eigengap Spectral Clustering (NME-SC) for pyannote pipelines.
+
+    Drop-in replacement for the `clustering` step of pyannote/speaker-diarization-3.1.
+    The affinity matrix, graph Laplacians and eigendecompositions are computed with torch
+    on `device` (GPU when available). The pruning parameter p is picked with a sparse
+    search, and the number of speakers comes from the largest eigengap.
+
+    Args:
+        device (str, optional): Torch device. Defaults to CUDA when available.
+        max_rp_threshold (float): Largest p searched, as a fraction of the number of embeddings.
+        sparse_search_volume (int): Number of p values tried between 1 and the largest p.
+        max_num_speakers (int): Upper bound on the estimated number of speakers.
+    """
+
+    def __init__(
+        self,
+        device: Optional[str] = None,
+        metric: str = "cosine",
+        max_num_embeddings: int = 1000,
+        constrained_assignment: bool = False,
+        max_rp_threshold: float = 0.15,
+        sparse_search_volume: int = 20,
+        max_num_speakers: int = 20
+    ):
+        super().__init__(
+            metric=metric,
+            max_num_embeddings=max_num_embeddings,
+            constrained_assignment=constrained_assignment
+        )
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        self.max_rp_threshold = max_rp_threshold
+        self.sparse_search_volume = sparse_search_volume
+        self.max_num_speakers = max_num_speakers
+
+    def _laplacian_spectrum(self, affinity: torch.Tensor, p: int):
+        """Eigen-decomposes the Laplacian of the affinity graph pruned to the top-p neighbours per row."""
+        top_p = torch.topk(affinity, p, dim=1).indices
+        graph = torch.zeros_like(affinity).scatter_(1, top_p, 1.0)
+        graph = 0.5 * (graph + graph.T)
+        laplacian = torch.diag(graph.sum(dim=1)) - graph
+        return torch.linalg.eigh(laplacian)
+
+    def cluster(self, embeddings: np.ndarray, min_clusters: int, max_clusters: int, num_clusters: Optional[int] = None) -> np.ndarray:
+        """
+        Clusters embeddings with NME-SC.
+
+        Args:
+            embeddings (np.ndarray): (num_embeddings, dimension) embeddings.
+            min_clusters (int): Minimum number of clusters.
+            max_clusters (int): Maximum number of clusters.
+            num_clusters (int, optional): Exact number of clusters, skipping estimation.
+
+        Returns:
+            np.ndarray: (num_embeddings,) cluster index of each embedding.
+        """
+        x = F.normalize(torch.as_tensor(embeddings, dtype=torch.float32, device=self.device), dim=1)
+        affinity = x @ x.T
+        affinity.fill_diagonal_(1.0)
+        affinity = (affinity - affinity.min()) / (affinity.max() - affinity.min()).clamp_min(1e-8)
+
+        num_embeddings = affinity.shape[0]
+        max_k = max(1, min(max_clusters, self.max_num_speakers, num_embeddings - 1))
+        min_k = max(1, min(min_clusters, max_k))
+
+        # Sparse search for the pruning parameter p minimizing p / N over the normalized max eigengap
+        max_p = max(1, int(self.max_rp_threshold * num_embeddings))
+        p_values = sorted(set(np.linspace(1, max_p, self.sparse_search_volume).round().astype(int).tolist()))
+        best_ratio, best_eigenvalues, best_eigenvectors = None, None, None
+        for p in p_values:
+            eigenvalues, eigenvectors = self._laplacian_spectrum(affinity, p)
+            gaps = eigenvalues[1:max_k + 1] - eigenvalues[:max_k]
+            normalized_gap = gaps.max() / (eigenvalues.max() + 1e-10)
+            ratio = (p / num_embeddings) / (normalized_gap.item() + 1e-10)
+            if best_ratio is None or ratio < best_ratio:
+                best_ratio, best_eigenvalues, best_eigenvectors = ratio, eigenvalues, eigenvectors
+
+        if num_clusters is None:
+            # gaps[i] separates i + 1 clusters from i + 2; restrict to [min_k, max_k]
+            gaps = best_eigenvalues[1:max_k + 1] - best_eigenvalues[:max_k]
+            num_clusters = int(torch.argmax(gaps[min_k - 1:max_k]).item()) + min_k
+        logger.debug(f"NME-SC estimated {num_clusters} clusters from {num_embeddings} embeddings")
+
+        spectral_embeddings = best_eigenvectors[:, :num_clusters].cpu().numpy()
+        return KMeans(n_clusters=num_clusters, n_init=10, random_state=0).fit_predict(spectral_embeddings)
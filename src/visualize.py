@@ -1,100 +1,234 @@
 import os
 import sys
+import glob
+import math
+import functools
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import librosa
-import librosa.display
-from pyannote.core import Segment, Timeline, Annotation
 import logging
 import argparse
-from typing import Optional, List, Tuple
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Optional, List, Tuple
 
 # Import necessary functions from your existing modules
-from preprocess import preprocess_audio
-from diarize import run_diarization
+from evaluate import read_rttm_to_annotation
+
+# matplotlib, soundfile, pyannote.core and the preprocess/diarize modules (torch, librosa) are
+# imported where they are used, so importing this module for `read_rttm_manual` stays cheap.
+if TYPE_CHECKING:
+    from pyannote.core import Annotation
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def read_rttm_manual(rttm_path: str) -> Annotation:
+@functools.lru_cache(maxsize=1)
+def _tab10_colors() -> tuple:
+    """Speaker colours, looked up once (plt.cm.get_cmap was removed in matplotlib 3.9)."""
+    import matplotlib
+    return matplotlib.colormaps['tab10'].colors
+
+# Narrowest speaker bar (in inches of plot width) that gets a text label
+_MIN_LABEL_WIDTH_INCHES = 0.3
+
+# Waveforms longer than this (about 5 minutes at 16 kHz) use the compiled envelope kernel;
+# for shorter ones the Numba import and compile would cost more than they save
+_NUMBA_ENVELOPE_MIN_SAMPLES = 5_000_000
+
+# Files whose decoded float32 PCM is larger than this are plotted from a streamed envelope
+# (`_envelope_streaming`) instead of being loaded, when no live diarization needs the samples
+_STREAMING_ENVELOPE_MIN_BYTES = 1 << 30
+
+# zlib level for saved PNGs: 1 encodes much faster than the default 6 for slightly larger files
+DEFAULT_PNG_COMPRESS = 1
+
+def _save_kwargs(output_path: str, dpi: int, png_compress: int) -> dict:
+    """Keyword arguments for savefig; the PNG compression level only applies to .png outputs."""
+    kwargs = {"dpi": dpi, "bbox_inches": "tight", "pad_inches": 0.1}
+    if output_path.lower().endswith(".png"):
+        kwargs["pil_kwargs"] = {"compress_level": png_compress, "optimize": False}
+    return kwargs
+
+def read_rttm_manual(rttm_path: str) -> "Annotation":
     """
-    Manually reads an RTTM file and returns a pyannote.core.Annotation object.
+    Reads an RTTM file and returns a pyannote.core.Annotation object.
+
+    The columns are parsed in one pass and the turns are bulk-inserted in sorted order
+    (evaluate.read_rttm_to_annotation), instead of one validated assignment per turn.
     """
-    annotation = Annotation()
-    try:
-        with open(rttm_path, 'r') as f:
-            for line in f:
-                parts = line.strip().split(' ')
-                if len(parts) >= 9 and parts[0] == 'SPEAKER':
-                    start = float(parts[3])
-                    duration = float(parts[4])
-                    speaker_id = parts[7]
-                    segment = Segment(start, start + duration)
-                    annotation[segment] = speaker_id
-        logger.info(f"Successfully loaded RTTM from {rttm_path}")
-    except Exception as e:
-        logger.error(f"Error reading RTTM file {rttm_path}: {e}")
-        sys.exit(1)
+    annotation = read_rttm_to_annotation(rttm_path)
+    logger.info(f"Successfully loaded RTTM from {rttm_path}")
     return annotation
 
-def plot_diarization(
-    waveform: np.ndarray,
-    sr: int,
-    diarization: Annotation,
-    output_png_path: str = None,
-    plot_width: float = 12,
-    plot_height: float = 6
-):
+@functools.lru_cache(maxsize=1)
+def _numba_envelope_kernel():
     """
-    Plots the audio waveform with speaker diarization segments overlaid.
+    Compiles a one-pass parallel max-|x| per bin kernel with Numba, or returns None if
+    Numba is not installed. Compiled on first use and cached on disk for later runs.
     """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def envelope_kernel(x, num_bins, bin_size):
+        out = np.empty(num_bins, dtype=x.dtype)
+        for i in prange(num_bins):
+            peak = abs(x[i * bin_size])
+            for j in range(i * bin_size + 1, (i + 1) * bin_size):
+                value = abs(x[j])
+                if value > peak:
+                    peak = value
+            out[i] = peak
+        return out
+
+    return envelope_kernel
+
+def _waveform_envelope(waveform: np.ndarray, sr: int, num_bins: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Downsamples a waveform to a peak envelope of at most num_bins points for display.
+
+    Returns the bin centre times (s) and the max |amplitude| of each bin.
+    """
+    num_bins = max(1, min(num_bins, len(waveform)))
+    bin_size = len(waveform) // num_bins
+    kernel = _numba_envelope_kernel() if len(waveform) > _NUMBA_ENVELOPE_MIN_SAMPLES else None
+    if kernel is not None:
+        # Single streaming pass over the samples, without the full-size |x| temporary
+        envelope = kernel(waveform, num_bins, bin_size)
+    else:
+        envelope = np.abs(waveform[:num_bins * bin_size]).reshape(num_bins, bin_size).max(axis=1)
+    times = (np.arange(num_bins) + 0.5) * (bin_size / sr)
+    return times, envelope
+
+def _envelope_bins(plot_width: float) -> int:
+    """About 100 envelope points per inch of plot width instead of every sample."""
+    return int(plot_width * 100)
+
+def _envelope_streaming(audio_path: str, num_bins: int, target_level: float = 0.1) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Computes the peak envelope of an audio file block by block, without loading it.
+
+    Mirrors `_waveform_envelope` on the preprocessed waveform: blocks are downmixed to mono and
+    reduced to per-bin max |amplitude| at the file's own rate, while the sum of squares is
+    accumulated in the same pass; the envelope is then scaled by the RMS-normalization gain
+    `preprocess_audio` would apply (peaks scale linearly). Memory stays at one ~10 s block.
+
+    Returns:
+        tuple: The bin centre times (s), the envelope, and the duration of the file (s).
+    """
+    import soundfile as sf
+
+    info = sf.info(audio_path)
+    num_bins = max(1, min(num_bins, info.frames))
+    bin_size = info.frames // num_bins
+    # Whole bins per block, so no bin straddles two blocks
+    blocksize = bin_size * max(1, (10 * info.samplerate) // bin_size)
+
+    envelope = np.zeros(num_bins, dtype=np.float32)
+    sum_squares, bin_index = 0.0, 0
+    for block in sf.blocks(audio_path, blocksize=blocksize, dtype='float32', always_2d=True):
+        mono = np.ascontiguousarray(block[:, 0] if block.shape[1] == 1 else block.mean(axis=1, dtype=np.float32))
+        sum_squares += float(np.dot(mono, mono))
+        block_bins = min(len(mono) // bin_size, num_bins - bin_index)
+        if block_bins > 0:
+            envelope[bin_index:bin_index + block_bins] = np.abs(mono[:block_bins * bin_size]).reshape(block_bins, bin_size).max(axis=1)
+            bin_index += block_bins
+
+    rms = math.sqrt(sum_squares / info.frames) if info.frames else 0.0
+    if rms >= 1e-8:
+        envelope *= target_level / rms
+    times = (np.arange(num_bins) + 0.5) * (bin_size / info.samplerate)
+    return times, envelope, info.frames / info.samplerate
+
+def _check_plot_inputs(waveform: Optional[np.ndarray], diarization: "Annotation", duration: Optional[float]) -> bool:
+    """Logs why a plot can't be drawn and returns False, or returns True."""
     # CORRECTED LINE: Use Python's boolean evaluation for emptiness [3]
     if not diarization:
         logger.warning("Diarization is empty. No speaker segments to plot.")
-        return
+        return False
+    if waveform is None and duration is None:
+        logger.error("Either a waveform or the audio duration is needed to plot the timeline.")
+        return False
+    return True
+
+def _render_into_ax(
+    ax,
+    waveform: Optional[np.ndarray],
+    sr: int,
+    diarization: "Annotation",
+    plot_width: float = 12,
+    duration: Optional[float] = None,
+    envelope: Optional[Tuple[np.ndarray, np.ndarray]] = None
+):
+    """
+    Draws the waveform envelope, speaker bars, labels and legend into an empty Axes.
+
+    envelope is an optional precomputed (times, peaks) pair, e.g. from `_envelope_streaming`,
+    drawn in place of the waveform's.
+    """
+    from matplotlib.patches import Patch
 
-    duration = librosa.get_duration(y=waveform, sr=sr)
+    if waveform is not None:
+        duration = waveform.shape[-1] / sr
     speakers = sorted(diarization.labels())
     num_speakers = len(speakers)
 
-    colors = plt.cm.get_cmap('tab10', max(10, num_speakers))
-    speaker_colors = {speaker: colors(i % 10) for i, speaker in enumerate(speakers)}
+    tab10 = _tab10_colors()
+    speaker_colors = {speaker: tab10[i % len(tab10)] for i, speaker in enumerate(speakers)}
 
-    fig, ax = plt.subplots(figsize=(plot_width, plot_height))
-    librosa.display.waveshow(waveform, sr=sr, ax=ax, alpha=0.6, color='grey')
+    if envelope is None and waveform is not None and len(waveform):
+        envelope = _waveform_envelope(waveform, sr, _envelope_bins(plot_width))
+    if envelope is not None:
+        times, peaks = envelope
+        waveform_layer = ax.fill_between(times, -peaks, peaks, color='grey', alpha=0.6, linewidth=0, zorder=-1)
+        waveform_layer.set_rasterized(True)
+        # Everything below zorder 0 (only the waveform) is rasterized in vector outputs
+        ax.set_rasterization_zorder(0)
+    else:
+        # Same layout as a normalized waveform, without decoding or drawing one
+        ax.set_ylim(-1.0, 1.0)
 
     y_offset_step = 0.08
     y_min_wave, y_max_wave = ax.get_ylim()
     speaker_plot_height = (y_max_wave - y_min_wave) * 0.15
     base_y_position = y_max_wave + (y_max_wave - y_min_wave) * 0.05
 
+    # Bin every turn by speaker in one pass, instead of one label_timeline walk per speaker
+    turns_per_speaker = defaultdict(list)
+    for segment, _, speaker in diarization.itertracks(yield_label=True):
+        turns_per_speaker[speaker].append((segment.start, segment.duration))
+
+    # Only label turns wide enough on screen to hold their text (about 0.3 inch), which
+    # bounds the number of Text artists by the plot width rather than the number of turns
+    min_label_duration = max(0.5, _MIN_LABEL_WIDTH_INCHES * duration / plot_width)
+
     handles = []
     for i, speaker in enumerate(speakers):
         color = speaker_colors[speaker]
-        speaker_segments = diarization.label_timeline(speaker)
-
-        for segment in speaker_segments:
-            rect = patches.Rectangle(
-                (segment.start, base_y_position + i * y_offset_step),
-                segment.duration,
-                speaker_plot_height,
-                facecolor=color,
-                edgecolor='none',
-                alpha=0.7,
-                label=speaker
-            )
-            ax.add_patch(rect)
+        y_position = base_y_position + i * y_offset_step
 
-            if segment.duration > 0.5:
-                ax.text(
-                    segment.start + segment.duration / 2,
-                    base_y_position + i * y_offset_step + speaker_plot_height / 2,
-                    speaker,
-                    ha='center', va='center', color='white', fontsize=8, weight='bold'
-                )
-        handles.append(patches.Patch(color=color, label=f'Speaker {speaker}'))
+        # All of this speaker's turns go into one collection (a single artist) instead of
+        # one Rectangle patch per turn
+        xranges = np.array(turns_per_speaker[speaker], dtype=np.float64).reshape(-1, 2)
+        ax.broken_barh(
+            xranges,
+            (y_position, speaker_plot_height),
+            facecolors=color,
+            edgecolor='none',
+            alpha=0.7,
+            label=speaker
+        )
+
+        for start, segment_duration in xranges[xranges[:, 1] > min_label_duration]:
+            ax.text(
+                start + segment_duration / 2,
+                y_position + speaker_plot_height / 2,
+                speaker,
+                ha='center', va='center', color='white', fontsize=8, weight='bold'
+            )
+        handles.append(Patch(color=color, label=f'Speaker {speaker}'))
 
     ax.set_title(f"Speaker Diarization - Duration: {duration:.2f}s")
     ax.set_xlabel("Time (s)")
@@ -102,28 +236,247 @@ def plot_diarization(
     ax.set_xlim(0, duration)
     ax.grid(True, linestyle='--', alpha=0.7)
     ax.set_ylim(bottom=y_min_wave, top=base_y_position + num_speakers * y_offset_step + speaker_plot_height + (y_max_wave - y_min_wave) * 0.05)
-    
-    unique_labels = {}
-    for h in handles:
-        unique_labels[h.get_label()] = h
-    ax.legend(handles=list(unique_labels.values()), loc='upper right', bbox_to_anchor=(1.15, 1.0))
-    
-    plt.tight_layout()
+
+    # One handle per speaker, built in the speaker loop, so no de-duplication is needed
+    ax.legend(handles=handles, loc='upper right', bbox_to_anchor=(1.15, 1.0))
+
+def plot_diarization(
+    waveform: Optional[np.ndarray],
+    sr: int,
+    diarization: "Annotation",
+    output_png_path: str = None,
+    plot_width: float = 12,
+    plot_height: float = 6,
+    duration: Optional[float] = None,
+    dpi: int = 150,
+    png_compress: int = DEFAULT_PNG_COMPRESS,
+    envelope: Optional[Tuple[np.ndarray, np.ndarray]] = None
+):
+    """
+    Plots the audio waveform with speaker diarization segments overlaid.
+
+    The waveform is the already-decoded array (the one passed to `run_diarization`), so
+    plotting never reads the audio file again. With waveform=None only the speaker timeline
+    is drawn, over `duration` seconds, on top of `envelope` (times, peaks) when one is given.
+    The dense waveform layer is rasterized; speaker bars and text stay vector artists.
+    To plot many files, `DiarizationPlotter` reuses one figure instead.
+    """
+    if not _check_plot_inputs(waveform, diarization, duration):
+        return
+
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(plot_width, plot_height))
+    _render_into_ax(ax, waveform, sr, diarization, plot_width=plot_width, duration=duration, envelope=envelope)
 
     if output_png_path:
+        # bbox_inches='tight' trims the saved image in one pass; tight_layout is only
+        # needed for the interactive window
         os.makedirs(os.path.dirname(output_png_path), exist_ok=True)
-        plt.savefig(output_png_path, dpi=300)
+        fig.savefig(output_png_path, **_save_kwargs(output_png_path, dpi, png_compress))
         logger.info(f"Plot saved to {output_png_path}")
         plt.close(fig)
     else:
+        fig.tight_layout()
         plt.show()
 
+class DiarizationPlotter:
+    """
+    Saves diarization plots for many files through one reused Figure.
+
+    The figure is created once and its Axes cleared between files, so the figure and
+    canvas set-up is paid once per batch rather than once per plot.
+
+    Example:
+        with DiarizationPlotter() as plotter:
+            for waveform, sr, diarization, path in results:
+                plotter.render(waveform, sr, diarization, path)
+    """
+
+    def __init__(self, plot_width: float = 12, plot_height: float = 6, dpi: int = 150, png_compress: int = DEFAULT_PNG_COMPRESS):
+        import matplotlib.pyplot as plt
+
+        self.plot_width = plot_width
+        self.dpi = dpi
+        self.png_compress = png_compress
+        self.fig, self.ax = plt.subplots(figsize=(plot_width, plot_height))
+
+    def render(self, waveform: Optional[np.ndarray], sr: int, diarization: "Annotation", output_png_path: str, duration: Optional[float] = None, envelope: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> bool:
+        """Draws one file's diarization into the shared Axes and saves it to output_png_path. Returns whether a plot was saved."""
+        if not _check_plot_inputs(waveform, diarization, duration):
+            return False
+        self.ax.clear()
+        _render_into_ax(self.ax, waveform, sr, diarization, plot_width=self.plot_width, duration=duration, envelope=envelope)
+
+        os.makedirs(os.path.dirname(output_png_path), exist_ok=True)
+        self.fig.savefig(output_png_path, **_save_kwargs(output_png_path, self.dpi, self.png_compress))
+        logger.info(f"Plot saved to {output_png_path}")
+        return True
+
+    def close(self):
+        """Releases the figure."""
+        import matplotlib.pyplot as plt
+        plt.close(self.fig)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _load_plot_audio(audio_path: str, no_waveform: bool = False, use_cache: bool = True, stream_bins: Optional[int] = None) -> Tuple[Optional[np.ndarray], Optional[int], Optional[float], Optional[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Loads what a plot needs from an audio file: (waveform, sr, duration, envelope).
+
+    With no_waveform only the header is read and waveform is None. With stream_bins set (only
+    when the samples themselves are not needed, i.e. the diarization comes from an RTTM file),
+    libsndfile-readable files over `_STREAMING_ENVELOPE_MIN_BYTES` of decoded PCM are reduced to
+    a stream_bins-point envelope block by block and waveform is None. Otherwise the waveform is
+    loaded and duration and envelope are None (they follow from it). Returns all None if the
+    audio can't be read.
+    """
+    if no_waveform or stream_bins is not None:
+        # Header only: frame count and sample rate, no decode
+        import soundfile as sf
+        try:
+            info = sf.info(audio_path)
+        except Exception as e:
+            if no_waveform:
+                logger.error(f"Could not read audio metadata from '{audio_path}': {e}")
+                return None, None, None, None
+            # Streaming needs a libsndfile-readable header; other formats (m4a, mp3, ...)
+            # are decoded whole by preprocess_audio below
+            logger.debug(f"libsndfile can't read '{audio_path}', not streaming its envelope: {e}")
+            info = None
+        if no_waveform:
+            return None, info.samplerate, info.frames / info.samplerate, None
+        if info is not None and info.frames * info.channels * 4 > _STREAMING_ENVELOPE_MIN_BYTES:
+            logger.info(f"Streaming the envelope of {audio_path} instead of loading it")
+            try:
+                times, peaks, duration = _envelope_streaming(audio_path, stream_bins)
+            except Exception as e:
+                logger.error(f"Could not stream audio from '{audio_path}': {e}")
+                return None, None, None, None
+            return None, info.samplerate, duration, (times, peaks)
+
+    from preprocess import preprocess_audio, preprocess_audio_cached
+
+    logger.info(f"Preprocessing audio: {audio_path}")
+    waveform, sr = preprocess_audio_cached(audio_path) if use_cache else preprocess_audio(audio_path)
+    if waveform is None:
+        logger.error(f"Audio preprocessing failed for '{audio_path}'.")
+        return None, None, None, None
+    # Everything downstream (envelope, diarization input) works in float32; this is a no-op
+    # for the usual float32 output and halves the buffer if a float64 one ever comes back
+    return np.ascontiguousarray(waveform, dtype=np.float32), sr, None, None
+
+def pair_audio_rttm_files(audio_paths: List[str], rttm_paths: List[str]) -> List[Tuple[str, str]]:
+    """
+    Pairs each audio file with its RTTM by file name.
+
+    Audio 'X.wav' matches an RTTM named 'X_diarization.rttm' (as written by diarize.py) or
+    'X.rttm'. Audio files without an RTTM are skipped with a warning.
+    """
+    rttm_by_name = {os.path.basename(path): path for path in rttm_paths}
+    pairs = []
+    for audio_path in sorted(audio_paths):
+        base = os.path.splitext(os.path.basename(audio_path))[0]
+        for candidate in (f"{base}_diarization.rttm", f"{base}.rttm"):
+            if candidate in rttm_by_name:
+                pairs.append((audio_path, rttm_by_name[candidate]))
+                break
+        else:
+            logger.warning(f"No RTTM file found for audio '{audio_path}'. Skipping.")
+    return pairs
+
+# One reused figure per batch worker process, created by _init_plot_worker
+_worker_plotter = None
+
+def _init_plot_worker(plot_width: float, plot_height: float, dpi: int, png_compress: int):
+    """Process pool initializer: selects the Agg backend and creates the worker's plotter."""
+    global _worker_plotter
+    import matplotlib
+    matplotlib.use('Agg')
+    _worker_plotter = DiarizationPlotter(plot_width, plot_height, dpi, png_compress)
+
+def _plot_file(audio_path: str, rttm_path: str, output_png_path: str, no_waveform: bool, use_cache: bool) -> bool:
+    """
+    Plots one (audio, RTTM) pair with the worker's plotter. Returns whether the plot was saved.
+
+    Any failure (including the sys.exit of a malformed RTTM) is logged and reported as False,
+    so one bad pair does not abort the rest of the batch.
+    """
+    try:
+        waveform, sr, duration, envelope = _load_plot_audio(
+            audio_path, no_waveform, use_cache, stream_bins=_envelope_bins(_worker_plotter.plot_width)
+        )
+        if sr is None:
+            return False
+        return _worker_plotter.render(waveform, sr, read_rttm_manual(rttm_path), output_png_path, duration=duration, envelope=envelope)
+    except (Exception, SystemExit) as e:
+        logger.error(f"Could not plot '{audio_path}' with '{rttm_path}': {e!r}")
+        return False
+
+def plot_batch(
+    pairs: List[Tuple[str, str]],
+    output_dir: str = "plots",
+    plot_width: float = 12,
+    plot_height: float = 6,
+    dpi: int = 150,
+    png_compress: int = DEFAULT_PNG_COMPRESS,
+    no_waveform: bool = False,
+    use_cache: bool = True,
+    num_workers: Optional[int] = None
+) -> dict:
+    """
+    Plots many (audio, RTTM) pairs in parallel, one process per CPU core by default.
+
+    Files are independent, so each worker process decodes, renders and saves its own files
+    through a single reused `DiarizationPlotter`, and the imports are paid once per worker.
+
+    Args:
+        pairs (list): (audio_path, rttm_path) tuples, e.g. from `pair_audio_rttm_files`.
+        output_dir (str): Directory for the PNG files (named <audio name>_diarization.png).
+        plot_width (float): Width of each plot in inches.
+        plot_height (float): Height of each plot in inches.
+        dpi (int): Resolution of the saved plots.
+        png_compress (int): zlib compression level of the saved PNGs.
+        no_waveform (bool): Only draw the speaker timelines, without decoding the audio.
+        use_cache (bool): Reuse cached preprocessed waveforms (see `preprocess_audio_cached`).
+        num_workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+
+    Returns:
+        dict: Maps each audio path to its saved plot path, or None if it failed.
+    """
+    output_paths = [
+        os.path.join(output_dir, f"{os.path.splitext(os.path.basename(audio_path))[0]}_diarization.png")
+        for audio_path, _ in pairs
+    ]
+    audio_paths = [audio_path for audio_path, _ in pairs]
+    rttm_paths = [rttm_path for _, rttm_path in pairs]
+
+    logger.info(f"Plotting {len(pairs)} files...")
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_plot_worker,
+        initargs=(plot_width, plot_height, dpi, png_compress)
+    ) as pool:
+        saved = pool.map(
+            _plot_file, audio_paths, rttm_paths, output_paths,
+            [no_waveform] * len(pairs), [use_cache] * len(pairs)
+        )
+        results = {audio_path: (path if ok else None) for audio_path, path, ok in zip(audio_paths, output_paths, saved)}
+
+    num_failed = sum(path is None for path in results.values())
+    logger.info(f"Saved {len(pairs) - num_failed} plots to {output_dir} ({num_failed} failed).")
+    return results
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description="Visualize Speaker Diarization results.",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument("input_audio", type=str, help="Path to the input audio file.")
+    parser.add_argument("input_audio", type=str, nargs="?", default=None, help="Path to the input audio file (omit with --glob).")
     parser.add_argument("--rttm_file", type=str, default=None, help="Optional: Path to an existing RTTM file. If provided, diarization is skipped.")
     parser.add_argument("--output_dir", type=str, default="plots", help="Directory to save the generated plot.")
     parser.add_argument("--output_name", type=str, default=None, help="Name of the output PNG file (without extension). Defaults to audio_filename_base_diarization.png.")
@@ -133,8 +486,40 @@ if __name__ == '__main__':
     parser.add_argument("--clustering_threshold", type=float, default=None, help="Clustering threshold (for live diarization, e.g., 0.7).")
     parser.add_argument("--plot_width", type=float, default=12, help="Width of the output plot in inches.")
     parser.add_argument("--plot_height", type=float, default=6, help="Height of the output plot in inches.")
+    parser.add_argument("--dpi", type=int, default=150, help="Resolution of the saved plot.")
+    parser.add_argument("--png_compress", type=int, default=DEFAULT_PNG_COMPRESS, choices=range(10), metavar="[0-9]", help="zlib compression level of the saved PNG (0 = none, 9 = smallest and slowest).")
+    parser.add_argument("--no_cache", action="store_true", help="Always re-run preprocessing instead of reusing the cached waveform of an unchanged file.")
+    parser.add_argument("--glob", type=str, default=None, help="Batch mode: glob pattern of audio files to plot in parallel, e.g. 'data/*.wav' (requires --rttm_glob).")
+    parser.add_argument("--rttm_glob", type=str, default=None, help="Batch mode: glob pattern of the RTTM files, matched to the audio files by name.")
+    parser.add_argument("--num_workers", type=int, default=None, help="Batch mode: number of worker processes (defaults to the number of CPUs).")
+    parser.add_argument("--no_waveform", action="store_true", help="Only draw the speaker timeline; the audio is not decoded (requires --rttm_file).")
     args = parser.parse_args()
 
+    # The CLI always saves to a file, so never initialize an interactive (Qt/Tk) backend
+    import matplotlib
+    matplotlib.use('Agg')
+
+    if args.glob:
+        if args.rttm_glob is None:
+            logger.error("Error: --glob requires --rttm_glob; batch mode plots existing RTTM files.")
+            sys.exit(1)
+        pairs = pair_audio_rttm_files(glob.glob(args.glob), glob.glob(args.rttm_glob))
+        if not pairs:
+            logger.error("No matching audio/RTTM pairs found.")
+            sys.exit(1)
+        results = plot_batch(
+            pairs, args.output_dir,
+            plot_width=args.plot_width, plot_height=args.plot_height,
+            dpi=args.dpi, png_compress=args.png_compress,
+            no_waveform=args.no_waveform, use_cache=not args.no_cache,
+            num_workers=args.num_workers
+        )
+        sys.exit(0 if all(results.values()) else 1)
+
+    if args.input_audio is None:
+        logger.error("Error: an input audio file (or --glob) is required.")
+        parser.print_help()
+        sys.exit(1)
     if not os.path.exists(args.input_audio):
         logger.error(f"Error: Audio file not found at '{args.input_audio}'")
         sys.exit(1)
@@ -145,13 +530,19 @@ if __name__ == '__main__':
     if args.rttm_file and not os.path.exists(args.rttm_file):
         logger.error(f"Error: RTTM file not found at '{args.rttm_file}'")
         sys.exit(1)
+    if args.no_waveform and args.rttm_file is None:
+        logger.error("Error: --no_waveform requires --rttm_file, since live diarization needs the audio.")
+        sys.exit(1)
 
-    logger.info(f"Preprocessing audio: {args.input_audio}")
-    waveform, sr = preprocess_audio(args.input_audio)
-    if waveform is None:
-        logger.error("Audio preprocessing failed. Exiting.")
+    # Live diarization needs the samples; an RTTM plot of a very long file only needs its envelope
+    waveform, sr, audio_duration, envelope = _load_plot_audio(
+        args.input_audio, no_waveform=args.no_waveform, use_cache=not args.no_cache,
+        stream_bins=_envelope_bins(args.plot_width) if args.rttm_file else None
+    )
+    if sr is None:
+        logger.error("Could not load the input audio. Exiting.")
         sys.exit(1)
-    
+
     audio_filename_base = os.path.splitext(os.path.basename(args.input_audio))[0]
     
     diarization_annotation = None
@@ -159,6 +550,8 @@ if __name__ == '__main__':
         logger.info(f"Loading diarization from RTTM file: {args.rttm_file}")
         diarization_annotation = read_rttm_manual(args.rttm_file)
     else:
+        from diarize import run_diarization
+
         logger.info("Running live diarization...")
         diarization_annotation = run_diarization(
             waveform, sr,
@@ -176,7 +569,11 @@ if __name__ == '__main__':
     plot_diarization(
         waveform, sr, diarization_annotation,
         output_png_path=output_png_path,
-        plot_width=args.plot_width, plot_height=args.plot_height
+        plot_width=args.plot_width, plot_height=args.plot_height,
+        duration=audio_duration,
+        dpi=args.dpi,
+        png_compress=args.png_compress,
+        envelope=envelope
     )
     logger.info("Visualization process complete.")
 